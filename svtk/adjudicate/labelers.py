@@ -9,106 +9,112 @@
 """
 
 import numpy as np
+import pandas as pd
 
 
 class TrainingLabeler:
+    """
+    Label variants as Pass/Fail training examples.
+
+    Subclasses define boolean masks over the metrics table; Fail takes
+    precedence over Pass and all remaining variants are Unlabeled.
+    """
     def __init__(self):
         pass
 
     def label(self, metrics):
-        return metrics.apply(self.label_row, axis=1)
+        labels = np.select([self.is_fail(metrics), self.is_pass(metrics)],
+                           ['Fail', 'Pass'], default='Unlabeled')
+        return pd.Series(labels, index=metrics.index)
+
+    def is_fail(self, metrics):
+        return np.zeros(metrics.shape[0], dtype=bool)
 
-    def label_row(self, row):
-        return 'Unlabeled'
+    def is_pass(self, metrics):
+        return np.zeros(metrics.shape[0], dtype=bool)
 
 
 class BAF1TrainingLabeler(TrainingLabeler):
-    def label_row(self, row):
-        if 0 <= row.RD_Median_Separation < 0.15:
-            return 'Fail'
-        elif 0.4 <= row.RD_Median_Separation < 1.0:
-            return 'Pass'
-        else:
-            return 'Unlabeled'
+    def is_fail(self, metrics):
+        sep = metrics.RD_Median_Separation
+        return ((0 <= sep) & (sep < 0.15)).to_numpy()
+
+    def is_pass(self, metrics):
+        sep = metrics.RD_Median_Separation
+        return ((0.4 <= sep) & (sep < 1.0)).to_numpy()
 
 
 class SR1TrainingLabeler(TrainingLabeler):
-    def label_row(self, row):
-        if (row.RD_Median_Separation < 0.15 and
-                row.BAF1_prob < 0.4 and
-                row.PE_log_pval < -np.log10(0.05)):
-            return 'Fail'
-        elif row.RD_Median_Separation >= 0.4 and row.BAF1_prob >= 0.9:
-            return 'Pass'
-        else:
-            return 'Unlabeled'
+    def is_fail(self, metrics):
+        return ((metrics.RD_Median_Separation < 0.15) &
+                (metrics.BAF1_prob < 0.4) &
+                (metrics.PE_log_pval < -np.log10(0.05))).to_numpy()
+
+    def is_pass(self, metrics):
+        return ((metrics.RD_Median_Separation >= 0.4) &
+                (metrics.BAF1_prob >= 0.9)).to_numpy()
 
 
 class RDTrainingLabeler(TrainingLabeler):
-    def label_row(self, row):
-        if 'depth' not in row['name'] and row.svsize >= 1000:
-            if row.BAF1_prob < 0.4 and row.SR1_prob < 0.4:
-                return 'Fail'
-            elif row.BAF1_prob >= 0.9 and row.SR1_prob >= 0.9:
-                return 'Pass'
-            else:
-                return 'Unlabeled'
-        elif 'depth' not in row['name'] and row.svsize < 1000:
-            if row.SR1_prob < 0.4:
-                return 'Fail'
-            elif row.SR1_prob >= 0.9:
-                return 'Pass'
-            else:
-                return 'Unlabeled'
-        else:
-            if row.BAF1_prob < 0.4:
-                return 'Fail'
-            elif row.BAF1_prob >= 0.9:
-                return 'Pass'
-            else:
-                return 'Unlabeled'
+    def _categories(self, metrics):
+        """Split variants into PE/SR >=1 kb, PE/SR <1 kb, and depth"""
+        pesr = ~metrics['name'].str.contains('depth', regex=False)
+        large = pesr & (metrics.svsize >= 1000)
+        small = pesr & (metrics.svsize < 1000)
+        depth = ~(large | small)
+        return large, small, depth
+
+    def is_fail(self, metrics):
+        large, small, depth = self._categories(metrics)
+        return ((large & (metrics.BAF1_prob < 0.4) &
+                 (metrics.SR1_prob < 0.4)) |
+                (small & (metrics.SR1_prob < 0.4)) |
+                (depth & (metrics.BAF1_prob < 0.4))).to_numpy()
+
+    def is_pass(self, metrics):
+        large, small, depth = self._categories(metrics)
+        return ((large & (metrics.BAF1_prob >= 0.9) &
+                 (metrics.SR1_prob >= 0.9)) |
+                (small & (metrics.SR1_prob >= 0.9)) |
+                (depth & (metrics.BAF1_prob >= 0.9))).to_numpy()
 
 
 class PETrainingLabeler(TrainingLabeler):
-    def label_row(self, row):
-        if row.SR1_prob < 0.4 and row.RD_prob < 0.4 and row.svsize >= 1000:
-            return 'Fail'
-        elif row.SR1_prob >= 0.9 and row.RD_prob >= 0.9 and row.svsize >= 1000:
-            return 'Pass'
-        else:
-            return 'Unlabeled'
+    def is_fail(self, metrics):
+        return ((metrics.SR1_prob < 0.4) & (metrics.RD_prob < 0.4) &
+                (metrics.svsize >= 1000)).to_numpy()
+
+    def is_pass(self, metrics):
+        return ((metrics.SR1_prob >= 0.9) & (metrics.RD_prob >= 0.9) &
+                (metrics.svsize >= 1000)).to_numpy()
 
 
 class BAF2TrainingLabeler(TrainingLabeler):
-    def label_row(self, row):
-        if (row.RD_prob < 0.4 and row.PE_prob < 0.4 and
-                row.SR1_prob < 0.4 and row.BAF1_prob < 0.4):
-            return 'Fail'
-        elif (row.RD_prob >= 0.9 and row.PE_prob >= 0.9 and
-                row.SR1_prob >= 0.9 and row.BAF1_prob >= 0.4):
-            return 'Pass'
-        else:
-            return 'Unlabeled'
+    def is_fail(self, metrics):
+        return ((metrics.RD_prob < 0.4) & (metrics.PE_prob < 0.4) &
+                (metrics.SR1_prob < 0.4) &
+                (metrics.BAF1_prob < 0.4)).to_numpy()
+
+    def is_pass(self, metrics):
+        return ((metrics.RD_prob >= 0.9) & (metrics.PE_prob >= 0.9) &
+                (metrics.SR1_prob >= 0.9) &
+                (metrics.BAF1_prob >= 0.4)).to_numpy()
 
 
 class SR2TrainingLabeler(TrainingLabeler):
-    def label_row(self, row):
-        if (row.RD_prob < 0.4 or row.PE_prob < 0.4):
-            return 'Fail'
-        elif (row.RD_prob >= 0.9 and row.PE_prob >= 0.9 and
-                row.SR1_prob >= 0.4):
-            return 'Pass'
-        else:
-            return 'Unlabeled'
+    def is_fail(self, metrics):
+        return ((metrics.RD_prob < 0.4) | (metrics.PE_prob < 0.4)).to_numpy()
+
+    def is_pass(self, metrics):
+        return ((metrics.RD_prob >= 0.9) & (metrics.PE_prob >= 0.9) &
+                (metrics.SR1_prob >= 0.4)).to_numpy()
 
 
 class PESRTrainingLabeler(TrainingLabeler):
-    def label_row(self, row):
-        if (row.RD_prob < 0.4 and row.PE_prob < 0.4 and
-                row.SR1_prob < 0.4):
-            return 'Fail'
-        elif (row.RD_prob >= 0.9 and row.PE_prob >= 0.9 and
-                row.SR1_prob >= 0.9):
-            return 'Pass'
-        else:
-            return 'Unlabeled'
+    def is_fail(self, metrics):
+        return ((metrics.RD_prob < 0.4) & (metrics.PE_prob < 0.4) &
+                (metrics.SR1_prob < 0.4)).to_numpy()
+
+    def is_pass(self, metrics):
+        return ((metrics.RD_prob >= 0.9) & (metrics.PE_prob >= 0.9) &
+                (metrics.SR1_prob >= 0.9)).to_numpy()
@@ -9,13 +9,19 @@
 """
 
 import sys
+import gc
 import numpy as np
 import pandas as pd
+from joblib import Parallel, delayed
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.preprocessing import LabelEncoder
 from sklearn.metrics import roc_curve
 
 
+RANDOM_STATE = 343124
+PARALLEL_PREDICT_MIN_SIZE = 10000
+PREDICT_BLOCK_SIZE = 16384
+
+
 def rf_classify(metrics, trainable, testable, features, labeler, cutoffs, name,
                 clean_cutoffs=False):
     """Wrapper to run random forest and assign probabilities"""
@@ -39,19 +45,28 @@ def rf_classify(metrics, trainable, testable, features, labeler, cutoffs, name,
 class RandomForest:
     def __init__(self, trainable, testable, features, cutoffs, labeler,
                  clean_cutoffs=False, max_train_size=100000):
-        def has_null_features(df):
-            return df[features].isnull().any(axis=1)
-
-        self.clean = trainable.loc[~has_null_features(trainable)].copy()
+        # Feature values are held as NumPy matrices alongside each table so
+        # the training and prediction paths avoid per-access pandas overhead
+        clean_X = trainable[features].to_numpy(dtype=np.float64)
+        is_clean = ~np.isnan(clean_X).any(axis=1)
+
+        # Only the training set gains new columns, so only it is copied
+        self.clean = trainable.iloc[is_clean].copy()
+        self._clean_X = clean_X[is_clean]
         if self.clean.shape[0] == 0:
             raise Exception('No clean variants found')
 
-        self.testable = testable.loc[~has_null_features(testable)].copy()
+        testable_X = testable[features].to_numpy(dtype=np.float64)
+        is_clean = ~np.isnan(testable_X).any(axis=1)
+        self.testable = testable.iloc[is_clean]
+        self._testable_X = testable_X[is_clean]
 
         self.features = features
 
+        # Testable feature matrix is reused for prediction, so build it once
+        self._X_test = np.ascontiguousarray(self._testable_X, dtype=np.float32)
+
         self.labeler = labeler
-        self.encoder = LabelEncoder().fit(['Fail', 'Pass'])
 
         self.clean_cutoffs = clean_cutoffs
         self.cutoff_features = cutoffs
@@ -72,42 +87,80 @@ class RandomForest:
 
     def label_training_data(self):
         self.clean['label'] = self.labeler.label(self.clean)
+        self._clean_labels = self.clean['label'].to_numpy()
 
     def select_training_data(self):
-        self.train = self.clean.loc[self.clean.label != 'Unlabeled']
+        labels = self._clean_labels
+        pass_idx = np.flatnonzero(labels == 'Pass')
+        fail_idx = np.flatnonzero(labels == 'Fail')
 
-        if self.train.shape[0] >= self.max_train_size:
+        if pass_idx.size + fail_idx.size >= self.max_train_size:
             max_subset_size = int(self.max_train_size / 2)
+            rng = np.random.default_rng(RANDOM_STATE)
 
-            passes = self.train.loc[self.train.label == 'Pass']
-            if passes.shape[0] >= max_subset_size:
-                passes = passes.sample(max_subset_size)
-
-            fails = self.train.loc[self.train.label == 'Fail']
-            if fails.shape[0] >= max_subset_size:
-                fails = fails.sample(max_subset_size)
+            if pass_idx.size >= max_subset_size:
+                pass_idx = rng.choice(pass_idx, size=max_subset_size,
+                                      replace=False)
+            if fail_idx.size >= max_subset_size:
+                fail_idx = rng.choice(fail_idx, size=max_subset_size,
+                                      replace=False)
 
-            self.train = pd.concat([passes, fails])
-
-        if self.train.loc[self.train.label == 'Pass'].shape[0] == 0:
+        if pass_idx.size == 0:
             raise Exception('No Pass variants included in training set')
-        if self.train.loc[self.train.label == 'Fail'].shape[0] == 0:
+        if fail_idx.size == 0:
             raise Exception('No Fail variants included in training set')
 
+        self.train_idx = np.sort(np.concatenate([pass_idx, fail_idx]))
+
     def learn_probs(self):
-        X_train = self.train[self.features].as_matrix()
+        # sklearn trees operate on float32; cast once rather than per call
+        X_train = np.ascontiguousarray(self._clean_X[self.train_idx],
+                                       dtype=np.float32)
 
-        y_train = self.encoder.transform(self.train.label)
+        # Fail/Pass encoded as 0/1, so Pass is the second predicted class
+        labels = self._clean_labels[self.train_idx]
+        y_train = (labels == 'Pass').astype(np.int8)
 
-        self.rf = RandomForestClassifier(n_estimators=500, random_state=343124,
-                                         oob_score=True, max_features=None)
+        self.rf = RandomForestClassifier(n_estimators=500,
+                                         random_state=RANDOM_STATE,
+                                         oob_score=False, max_features=None,
+                                         n_jobs=-1)
 
         self.rf.fit(X_train, y_train)
 
-        X = self.testable[self.features].as_matrix()
-        probs = self.rf.predict_proba(X)
+        # Release training buffers before prediction allocates its own
+        del X_train, y_train, labels
+        self._clean_X = None
+        gc.collect()
+
+        self.probs = self.predict_pass_probs(self._X_test)
+
+    def predict_pass_probs(self, X):
+        """
+        Average the trees' Pass probabilities into a single output array.
+
+        Rows are predicted in blocks of PREDICT_BLOCK_SIZE, each block passing
+        through every tree before moving on, so the block stays resident in
+        cache. Unlike RandomForestClassifier.predict_proba, no per-tree
+        probability matrix is retained. X must be a C-contiguous float32
+        matrix.
+        """
+        probs = np.zeros(X.shape[0], dtype=np.float64)
 
-        self.probs = probs[:, 1]
+        # Thread startup outweighs the gain on small prediction sets
+        n_jobs = 1 if X.shape[0] < PARALLEL_PREDICT_MIN_SIZE else -1
+
+        # Blocks write to disjoint slices of probs, so no lock is required
+        blocks = [slice(start, start + PREDICT_BLOCK_SIZE)
+                  for start in range(0, X.shape[0], PREDICT_BLOCK_SIZE)]
+        Parallel(n_jobs=n_jobs, require='sharedmem')(
+            delayed(_accumulate_pass_probs)(self.rf.estimators_,
+                                            X[block], probs[block])
+            for block in blocks)
+
+        probs /= len(self.rf.estimators_)
+
+        return probs
 
     def learn_cutoffs(self):
         cutoffs = {}
@@ -117,61 +170,80 @@ class RandomForest:
         else:
             cutoff_metrics = self.testable
 
-        cutoff_metrics['pass_cutoffs'] = True
-        passing = cutoff_metrics['pass_cutoffs']
+        pass_cutoffs = np.ones(cutoff_metrics.shape[0], dtype=bool)
+
+        # Positions of cutoff variants within the testable probabilities
+        if cutoff_metrics is self.testable:
+            idx = np.arange(self.testable.shape[0])
+        else:
+            idx = self.testable.index.get_indexer(cutoff_metrics.index)
+        probs = self.probs[idx]
 
         for feature in self.cutoff_features['indep']:
             metric = cutoff_metrics[feature]
-            idx = np.searchsorted(self.testable.index, cutoff_metrics.index)
-            cutoff = learn_cutoff(metric, self.probs[idx])
+            cutoff = learn_cutoff(metric, probs)
 
             cutoffs[feature] = cutoff
-            passing = passing & (cutoff_metrics[feature] >= cutoff)
+            pass_cutoffs &= (metric.to_numpy() >= cutoff)
 
-        passing = cutoff_metrics.loc[passing]
+        passing = cutoff_metrics.iloc[pass_cutoffs]
+        # Subset probabilities to those in passing set
+        probs = probs[pass_cutoffs]
         for feature in self.cutoff_features['dep']:
             metric = passing[feature]
-            # Subset probabilities to those in passing set
-            idx = np.searchsorted(self.testable.index, passing.index)
-            cutoffs[feature] = learn_cutoff(metric, self.probs[idx])
+            cutoffs[feature] = learn_cutoff(metric, probs)
 
-        self.cutoffs = pd.DataFrame.from_dict({'cutoff': cutoffs},
-                                              orient='columns')\
-                                   .reset_index()
-        self.cutoffs = self.cutoffs.rename(columns=dict(index='metric'))
+        self.cutoffs = pd.DataFrame({'metric': list(cutoffs.keys()),
+                                     'cutoff': list(cutoffs.values())})
 
     def cutoff_probs(self):
-        self.testable['prob'] = self.probs
-        passes = self.testable.prob >= 0.5
+        metrics = self.cutoffs['metric'].tolist()
+        cutoffs = self.cutoffs['cutoff'].to_numpy()
+
+        # Compare against the float64 features so the learned cutoffs,
+        # which are observed feature values, are not perturbed by rounding
+        if set(metrics).issubset(self.features):
+            cols = [self.features.index(metric) for metric in metrics]
+            values = self._testable_X[:, cols]
+        else:
+            values = self.testable[metrics].to_numpy()
+
+        below_cutoffs = (values < cutoffs).any(axis=1)
+        passes_all_cutoffs = (values >= cutoffs).all(axis=1)
 
-        self.testable['passes_all_cutoffs'] = True
+        probs = self.probs.copy()
 
         # If metrics are below the observed cutoff, force failure
-        for idx, row in self.cutoffs.iterrows():
-            metric, cutoff = row['metric'], row['cutoff']
-            self.testable.loc[passes & (self.testable[metric] < cutoff), 'prob'] = 0.499
+        probs[(probs >= 0.5) & below_cutoffs] = 0.499
+        probs[passes_all_cutoffs & (probs < 0.5)] = 0.501
 
-            self.testable['passes_all_cutoffs'] = self.testable.passes_all_cutoffs & (self.testable[metric] >= cutoff)
+        self.passes_all_cutoffs = passes_all_cutoffs
+        self.probs = probs
 
-        self.testable.loc[self.testable.passes_all_cutoffs & (self.testable.prob < 0.5), 'prob'] = 0.501
 
-        self.probs = self.testable.prob.as_matrix()
+def _accumulate_pass_probs(trees, X, out):
+    """Sum the Pass probabilities of each tree over a block of rows"""
+    for tree in trees:
+        out += tree.predict_proba(X, check_input=False)[:, 1]
+
 
 def learn_cutoff(metric, probs):
-    preds = metric.as_matrix()
+    preds = metric.to_numpy(copy=False)
 
     # Pass/fail if greater/less than 0.5
-    classify = np.vectorize(lambda x: 1 if x >= 0.5 else 0)
-    truth = classify(probs)
+    truth = (probs >= 0.5).view(np.uint8)
 
     # If all variants which passed prior cutoffs also passed random forest,
     # return minimum value instead of trying to compute cutoff
     if 0 not in truth:
         return preds.min()
 
-    fpr, tpr, thresh = roc_curve(truth, preds)
-    dist = np.sqrt((fpr - 0) ** 2 + (tpr - 1) ** 2)
-    best_idx = np.argmin(dist)
+    fpr, tpr, thresh = roc_curve(truth, preds, drop_intermediate=True)
+
+    # Closest point to (0, 1); argmin of squared distance suffices
+    dist = fpr * fpr
+    dist += (tpr - 1.0) ** 2
+    best_idx = int(dist.argmin())
 
     # If cutoff set at no instances, scikit-learn sets thresh[0] to max(y_score) + 1
     if best_idx == 0:
@@ -19,26 +19,108 @@ individual coordinates.
 import argparse
 import sys
 import os
-from collections import namedtuple, deque, defaultdict
+import itertools
+from collections import deque, defaultdict
 import numpy as np
-from scipy import sparse
-from scipy.sparse import csgraph
+import pandas as pd
 import pybedtools as pbt
+import svtk.utils as svu
 
 
-BedCall = namedtuple('BedCall', 'chrom start end name sample svtype'.split())
+# Output columns: chrom, start, end, cluster ID, svtype, sample, call name,
+# and the tab-prefixed cluster statistics
+format_entry = '{0}\t{1}\t{2}\t{3}\t{4}\t{5}\t{6}{7}\n'.format
+format_stats = '\t{0:.3f}\t{1}\t{2:.3f}\t{3:.3f}'.format
 
 
-def rmsstd(intervals):
-    starts = np.array([interval.start for interval in intervals])
-    ends = np.array([interval.end for interval in intervals])
+def interval_coords(intervals):
+    """Array of interval (start, end) coordinates, one row per interval"""
+    coords = np.fromiter(itertools.chain.from_iterable(
+                            (interval.start, interval.end)
+                            for interval in intervals),
+                         dtype=np.int64, count=2 * len(intervals))
 
-    def _meanSS(X):
-        mu = np.mean(X)
-        return np.sum((X - mu) ** 2) / len(X)
+    return coords.reshape(-1, 2)
 
-    SS = _meanSS(starts) + _meanSS(ends)
-    return np.sqrt(SS)
+
+def rmsstd(coords):
+    """Root-mean-square standard deviation of interval starts and ends"""
+    # Most clusters are singletons, which have no spread
+    if coords.shape[0] < 2:
+        return 0.0
+
+    return np.sqrt(coords.var(axis=0).sum())
+
+
+def reciprocal_overlap_pairs(intervals, frac):
+    """
+    Find pairs of intervals with reciprocal overlap of at least frac.
+
+    Only intervals on the same chromosome and of the same svtype are paired,
+    matching `bedtools intersect -r -f frac`. Each group of intervals is swept
+    in order of start, comparing each interval to those downstream of it
+    until no interval can still be overlapped enough.
+
+    Parameters
+    ----------
+    intervals : list of pybedtools.Interval
+        Columns: chr, start, end, name, sample, svtype.
+    frac : float
+
+    Returns
+    -------
+    src, dst : np.ndarray of int
+        Indices of linked intervals
+    """
+    groups = defaultdict(list)
+    for idx, interval in enumerate(intervals):
+        groups[(interval.chrom, interval[5])].append(idx)
+
+    src, dst = [np.empty(0, dtype=np.intp)], [np.empty(0, dtype=np.intp)]
+    for idxs in groups.values():
+        idxs = np.array(idxs)
+        starts = np.array([intervals[i].start for i in idxs])
+        ends = np.array([intervals[i].end for i in idxs])
+
+        order = np.argsort(starts, kind='mergesort')
+        idxs, starts, ends = idxs[order], starts[order], ends[order]
+
+        linkA, linkB = svu.reciprocal_overlap_links(starts, ends, frac)
+        src.append(idxs[linkA])
+        dst.append(idxs[linkB])
+
+    return np.concatenate(src), np.concatenate(dst)
+
+
+def intersection_pairs(intervals, intersection):
+    """
+    Find pairs of linked intervals in a pre-computed self-intersection.
+
+    Returns
+    -------
+    src, dst : np.ndarray of int
+        Indices of linked intervals
+    """
+    # Map variant IDs to graph indices
+    variant_indexes = dict((interval.fields[3].strip(), i)
+                           for i, interval in enumerate(intervals))
+
+    # Only the name, svtype, and chrB columns are needed to link calls
+    cols = ['nameA', 'svtypeA', 'chrB', 'nameB', 'svtypeB']
+    try:
+        hits = pd.read_csv(intersection.fn, sep='\t', header=None,
+                           usecols=[3, 5, 6, 9, 11],
+                           dtype=str, keep_default_na=False)
+    except pd.errors.EmptyDataError:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    hits.columns = cols
+
+    # Link the two calls from each line
+    linked = (hits.chrB != '.') & (hits.svtypeA == hits.svtypeB)
+    src = hits.nameA[linked].map(variant_indexes).to_numpy(dtype=np.intp)
+    dst = hits.nameB[linked].map(variant_indexes).to_numpy(dtype=np.intp)
+
+    return src, dst
 
 
 def bedcluster(bed, frac=0.8, intersection=None):
@@ -47,7 +129,7 @@ def bedcluster(bed, frac=0.8, intersection=None):
 
     Parameters
     ----------
-    bed : pybedtools.BedTool
+    bed : pybedtools.BedTool or list of pybedtools.Interval
         Columns: chr, start, end, name, sample, svtype.
     frac : float
         Minimum reciprocal overlap for two variants to be linked together.
@@ -61,40 +143,26 @@ def bedcluster(bed, frac=0.8, intersection=None):
     clusters : list of deque of pybedtools.Interval
     """
 
-    # Get list of unique variant IDs and initialize sparse graph
-    variant_IDs = [interval.fields[3] for interval in bed.intervals]
-    G = sparse.eye(len(variant_IDs), dtype=np.uint16, format='lil')
-
-    # Map variant IDs to graph indices
-    variant_indexes = {}
-    for i, variant in enumerate(variant_IDs):
-        variant_indexes[variant.strip()] = i
+    intervals = list(bed)
 
-    # Self-intersect the bed
+    # Link intervals based on reciprocal overlap
     if intersection is None:
-        intersection = bed.intersect(bed, wa=True, wb=True, loj=True,
-                                     r=True, f=frac)
-
-    # Cluster intervals based on reciprocal overlap
-    for interval in intersection.intervals:
-        # Make fields accessible by name
-        c1 = BedCall(*interval.fields[:6])
-        c2 = BedCall(*interval.fields[6:])
-
-        # Link the two calls from the current line
-        if c2.chrom != '.' and c1.svtype == c2.svtype:
-            idx1 = variant_indexes[c1.name]
-            idx2 = variant_indexes[c2.name]
-            G[idx1, idx2] = 1
+        src, dst = reciprocal_overlap_pairs(intervals, frac)
+    else:
+        src, dst = intersection_pairs(intervals, intersection)
 
     # Cluster graph
-    n_comp, cluster_labels = csgraph.connected_components(G, connection='weak')
+    n_comp, cluster_labels = svu.connected_components(len(intervals),
+                                                      src, dst)
+
+    if n_comp == 0:
+        return []
 
-    # Build deques of clustered Intervals
-    clusters = [deque() for i in range(n_comp)]
-    for idx, interval in enumerate(bed.intervals):
-        label = cluster_labels[idx]
-        clusters[label].append(interval)
+    # Build deques of clustered Intervals, with members in bed order
+    order = np.argsort(cluster_labels, kind='stable')
+    bounds = np.flatnonzero(np.diff(cluster_labels[order])) + 1
+    clusters = [deque(intervals[idx] for idx in members)
+                for members in np.split(order, bounds)]
 
     return clusters
 
@@ -113,34 +181,35 @@ def collapse_sample_calls(cluster):
     """
 
     interval_dict = defaultdict(list)
-    variants = deque()
 
     # Get all calls in each sample
     for interval in cluster:
-        sample = interval.fields[4]
+        sample = interval[4]
         interval_dict[sample].append(interval)
 
     # If a sample has only one call, keep it, otherwise merge
-    for sample, intervals in interval_dict.items():
-        if len(intervals) == 1:
-            variants.append(intervals[0])
-            continue
-
-        # Track IDs of merged variants
-        name = ','.join([interval.name for interval in intervals])
-
-        # To merge variants in a sample, take broadest range
-        start = np.min([interval.start for interval in intervals])
-        end = np.max([interval.end for interval in intervals])
-
+    variants = []
+    for intervals in interval_dict.values():
         interval = intervals[0]
-        interval.start = start
-        interval.end = end
-        interval.name = name
+        if len(intervals) > 1:
+            # To merge variants in a sample, take broadest range
+            start, end = interval.start, interval.end
+            for other in intervals[1:]:
+                if other.start < start:
+                    start = other.start
+                if other.end > end:
+                    end = other.end
+
+            # Track IDs of merged variants
+            name = ','.join([i.name for i in intervals])
+
+            interval.start = start
+            interval.end = end
+            interval.name = name
 
         variants.append(interval)
 
-    return list(variants)
+    return variants
 
 
 def main(argv):
@@ -198,47 +267,52 @@ def main(argv):
     else:
         intersection = None
 
-    clusters = bedcluster(bed, args.frac, intersection)
+    # Parse the bed once for clustering and VAF calculation
+    intervals = list(bed)
+    clusters = bedcluster(intervals, args.frac, intersection)
 
-    # Get samples for VAF calculation
-    samples = sorted(set([interval.fields[4] for interval in bed.intervals]))
+    # Get samples for VAF calculation. Indexing the Interval directly avoids
+    # building the list of all its fields
+    samples = set(interval[4] for interval in intervals)
     num_samples = float(len(samples))
 
     for i, cluster in enumerate(clusters):
         # Calculate RMSSTD before merging per-sample variants
-        pre_RMSSTD = rmsstd(cluster)
+        pre_RMSSTD = rmsstd(interval_coords(cluster))
 
         # Make a single variant for each sample
         cluster = collapse_sample_calls(cluster)
 
         # Re-calculate RMSSTD after merging per-sample variants
-        post_RMSSTD = rmsstd(cluster)
+        coords = interval_coords(cluster)
+        post_RMSSTD = rmsstd(coords)
 
         # Merge coordinates AFTER getting min/max per sample
         if args.merge_coordinates:
             # Report median region of overlap
-            start = int(np.median([int(call.start) for call in cluster]))
-            end = int(np.median([int(call.end) for call in cluster]))
+            start, end = (int(x) for x in np.median(coords, axis=0))
 
             for interval in cluster:
                 interval.start = start
                 interval.end = end
 
-        # Get variant frequency info
-        vac = len(set([call.fields[4] for call in cluster]))
+        # Get variant frequency info (one call per sample after collapsing)
+        vac = len(cluster)
         vaf = vac / num_samples
 
         # Assign cluster ID
         cid = args.prefix + ('_%d' % i)
 
-        for interval in cluster:
-            entry = '{0}\t{1}\t{2}\t{{cid}}\t{5}\t{4}\t{3}'
-            entry = entry.format(*interval.fields)
+        # Cluster-level columns are shared by every entry
+        stats = format_stats(vaf, vac, pre_RMSSTD, post_RMSSTD)
 
-            entry = (entry + '\t{vaf:.3f}\t{vac}\t{pre_RMSSTD:.3f}\t'
-                     '{post_RMSSTD:.3f}\n').format(**locals())
+        entries = []
+        for interval in cluster:
+            chrom, start, end, name, sample, svtype = interval.fields
+            entries.append(format_entry(chrom, start, end, cid, svtype,
+                                        sample, name, stats))
 
-            args.fout.write(entry)
+        args.fout.write(''.join(entries))
 
 
 if __name__ == '__main__':
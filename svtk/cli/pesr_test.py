@@ -11,10 +11,46 @@ Calculate enrichment of clipped reads or discordant pairs at SV breakpoints.
 import argparse
 import sys
 import pysam
+import numpy as np
 import pandas as pd
 from svtk.pesr import SRTestRunner, PETestRunner, PETest, SRTest
 
 
+def fill_counts(counts, samples, name='.'):
+    """
+    Count for each of a list of samples, with zero for unobserved samples.
+
+    Parameters
+    ----------
+    counts : pd.DataFrame
+        Columns: sample, count
+    samples : list of str
+    name : str, optional
+        Record ID, for error messages
+
+    Returns
+    -------
+    counts : np.ndarray of int
+
+    Raises
+    ------
+    ValueError
+        If any count is non-finite (e.g. normalized by a median of zero)
+    """
+    observed = dict(zip(counts['sample'], counts['count'].fillna(0)))
+    filled = np.fromiter((observed.get(s, 0) for s in samples),
+                         dtype=float, count=len(samples))
+
+    finite = np.isfinite(filled)
+    if not finite.all():
+        sample = samples[np.flatnonzero(~finite)[0]]
+        msg = 'Non-finite count for sample {0} in record {1}'
+        msg = msg.format(sample, name)
+        raise ValueError(msg)
+
+    return filled.astype(int)
+
+
 def sr_test(argv):
     parser = argparse.ArgumentParser(
         description="Calculate enrichment of clipped reads at SV breakpoints.",
@@ -232,15 +268,10 @@ def count_pe(argv):
     for record in vcf:
         counts = petest.load_counts(record, args.window_in, args.window_out)
         counts = petest.normalize_counts(counts)
-        counts = counts.set_index('sample')
-        counts = counts.reindex(whitelist).fillna(0).astype(int)
-        counts = counts.reset_index()
-        counts['name'] = record.id
-        cols = 'name sample count'.split()
+        counts = fill_counts(counts, whitelist, record.id)
 
-        for row in counts[cols].as_matrix():
-            fout.write('\t'.join([str(x) for x in row]) + '\n')
-        #  counts[cols].to_csv(fout, header=False, index=False, sep='\t', na_rep='NA')
+        for sample, count in zip(whitelist, counts.tolist()):
+            fout.write('{0}\t{1}\t{2}\n'.format(record.id, sample, count))
 
 
 def count_sr(argv):
@@ -313,13 +344,8 @@ def count_sr(argv):
 
             counts = srtest.load_counts(record.chrom, pos, strand)
             counts = srtest.normalize_counts(counts)
-            counts = counts['sample count'.split()]
-            counts = counts.set_index('sample')
-            counts = counts.reindex(whitelist).fillna(0).astype(int)
-            counts = counts.reset_index()
-            counts['name'] = record.id
-            counts['coord'] = coord
-
-            for row in counts[header].as_matrix():
-                fout.write('\t'.join([str(x) for x in row]) + '\n')
-            #  counts[header].to_csv(fout, header=False, index=False, sep='\t', na_rep='NA')
+            counts = fill_counts(counts, whitelist, record.id)
+
+            for sample, count in zip(whitelist, counts.tolist()):
+                fout.write('{0}\t{1}\t{2}\t{3}\n'.format(
+                    record.id, coord, sample, count))
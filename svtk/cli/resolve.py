@@ -11,15 +11,16 @@ Resolve complex SV from inversion/translocation breakpoints and CNV intervals.
 import argparse
 import sys
 import subprocess
-import random
-import string
+import os
+import base64
 from collections import deque
 import itertools
 import pysam
 import pandas as pd
 import pybedtools as pbt
 import svtk.utils as svu
-from svtk.cxsv import link_cpx, ComplexSV, rescan_single_ender,link_cpx_V2
+from svtk.cxsv import link_cpx, ComplexSV, rescan_single_ender,link_cpx_V2, \
+    make_cytoband_index, make_mei_index
 import datetime
 
 
@@ -37,42 +38,39 @@ CPX_INFO = [
 ]
 
 
+def _random_id():
+    """
+    Random 10-character ID (A-Z, 2-7) to keep variant IDs unique across shards
+    """
+    return base64.b32encode(os.urandom(7))[:10].decode()
+
+
 def _merge_records(vcf, cpx_records, cpx_record_ids):
     """
     r1, r2 : iter of pysam.VariantRecord
     """
-    def _next_record():
-        try:
-            return next(vcf)
-        except StopIteration:
-            return None
-    def _next_cpx():
-        try:
-            return cpx_records.popleft()
-        except IndexError:
-            return None
     # Initialize merge
-    curr_record = _next_record()
-    curr_cpx = _next_cpx()
+    curr_record = next(vcf, None)
+    curr_cpx = cpx_records.popleft() if cpx_records else None
     while curr_record is not None and curr_cpx is not None:
         # Remove VCF records that were included in complex event
         if curr_record.id in cpx_record_ids:
-            curr_record = _next_record()
+            curr_record = next(vcf, None)
             continue
         # Merge sort remaining
         if curr_record.chrom == curr_cpx.chrom:
             if curr_record.pos <= curr_cpx.pos:
                 yield curr_record
-                curr_record = _next_record()
+                curr_record = next(vcf, None)
             else:
                 yield curr_cpx
-                curr_cpx = _next_cpx()
+                curr_cpx = cpx_records.popleft() if cpx_records else None
         elif svu.is_smaller_chrom(curr_record.chrom, curr_cpx.chrom):
             yield curr_record
-            curr_record = _next_record()
+            curr_record = next(vcf, None)
         else:
             yield curr_cpx
-            curr_cpx = _next_cpx()
+            curr_cpx = cpx_records.popleft() if cpx_records else None
     # After one iterator is exhausted, return rest of other iterator
     if curr_record is None:
         for cpx in itertools.chain([curr_cpx], cpx_records):
@@ -155,7 +153,7 @@ def clusters_cleanup(clusters):
     return out
 
 
-def resolve_complex_sv(vcf, cytobands, disc_pairs, mei_bed,variant_prefix='CPX_', 
+def resolve_complex_sv(vcf, cytobands, disc_pairs, mei_index,variant_prefix='CPX_', 
                        min_rescan_support=4, pe_blacklist=None, quiet=False,
                        SR_only_cutoff=1000):
     """
@@ -164,9 +162,11 @@ def resolve_complex_sv(vcf, cytobands, disc_pairs, mei_bed,variant_prefix='CPX_'
     Parameters
     ----------
     vcf : pysam.VariantFile
-    cytobands : pysam.TabixFile
+    cytobands : dict
+        Cytobands indexed by svtk.cxsv.make_cytoband_index()
     disc_pairs : pysam.TabixFile
-    mei_bed : pybedtools.BedTool
+    mei_index : dict
+        MEI intervals indexed by svtk.cxsv.make_mei_index()
     variant_prefix : str
         Prefix to assign to resolved variants
     min_rescan_support : int
@@ -219,20 +219,20 @@ def resolve_complex_sv(vcf, cytobands, disc_pairs, mei_bed,variant_prefix='CPX_'
         # if cxsv overlap pulled in unrelated insertions, keep them separate
         if all([r.info['SVTYPE'] == 'INS' for r in cluster]):
             for record in cluster:
-                cpx = ComplexSV([record], cytobands, mei_bed, SR_only_cutoff)
-                cpx_record_ids = cpx_record_ids.union(cpx.record_ids)
+                cpx = ComplexSV([record], cytobands, mei_index, SR_only_cutoff)
+                cpx_record_ids.update(cpx.record_ids)
                 
                 # Assign random string as resolved ID to handle sharding
-                cpx.vcf_record.id = variant_prefix + ''.join(random.choice(string.ascii_uppercase + string.digits) for _ in range(10))
+                cpx.vcf_record.id = variant_prefix + _random_id()
                 cpx_records.append(cpx.vcf_record)
                 # resolved_idx += 1
             outcome = 'treated as separate unrelated insertions'
         else:
-            cpx = ComplexSV(cluster, cytobands, mei_bed, SR_only_cutoff)
-            cpx_record_ids = cpx_record_ids.union(cpx.record_ids)
+            cpx = ComplexSV(cluster, cytobands, mei_index, SR_only_cutoff)
+            cpx_record_ids.update(cpx.record_ids)
             if cpx.svtype == 'UNR':
                 # Assign random string as unresolved ID to handle sharding
-                unresolved_vid = 'UNRESOLVED_' + ''.join(random.choice(string.ascii_uppercase + string.digits) for _ in range(10))
+                unresolved_vid = 'UNRESOLVED_' + _random_id()
                 for i, record in enumerate(cpx.records):
                     record.info['EVENT'] = unresolved_vid
                     record.info['UNRESOLVED'] = True
@@ -258,7 +258,7 @@ def resolve_complex_sv(vcf, cytobands, disc_pairs, mei_bed,variant_prefix='CPX_'
                           'The following records were merged into the INS record: ' + \
                           ', '.join(cnv_ids_to_append)
             else:
-                cpx.vcf_record.id = variant_prefix + ''.join(random.choice(string.ascii_uppercase + string.digits) for _ in range(10))
+                cpx.vcf_record.id = variant_prefix + _random_id()
                 cpx_records.append(cpx.vcf_record)
                 if 'CPX_TYPE' in cpx.vcf_record.info.keys():
                     outcome = 'resolved as ' + str(cpx.vcf_record.info['CPX_TYPE'])
@@ -284,18 +284,14 @@ def resolve_complex_sv(vcf, cytobands, disc_pairs, mei_bed,variant_prefix='CPX_'
             record.info['UNRESOLVED'] = True
             if 'UNRESOLVED_TYPE' not in record.info.keys():
                 record.info['UNRESOLVED_TYPE'] = 'SINGLE_ENDER'
-        if 'CPX_TYPE' in record.info.keys():
-            if 'UNRESOLVED' in record.info.keys():
-                record.info['UNRESOLVED_TYPE'] = record.info['CPX_TYPE']
-                record.info.pop('CPX_TYPE')
+        if 'CPX_TYPE' in record.info:
+            if 'UNRESOLVED' in record.info:
+                record.info['UNRESOLVED_TYPE'] = record.info.pop('CPX_TYPE')
             else:
-                record.info.pop('STRANDS')
-        if 'CIPOS' in record.info.keys():
-            record.info.pop('CIPOS')
-        if 'CIEND' in record.info.keys():
-            record.info.pop('CIEND')
-        if 'RMSSTD' in record.info.keys():
-            record.info.pop('RMSSTD')
+                record.info.pop('STRANDS', None)
+        record.info.pop('CIPOS', None)
+        record.info.pop('CIEND', None)
+        record.info.pop('RMSSTD', None)
         yield record
 
 def cluster_cleanup(clusters_v2):
@@ -311,7 +307,7 @@ def cluster_cleanup(clusters_v2):
     return [clusters_v2[i] for i in cluster_pos]
 
 def resolve_complex_sv_v2(resolve_CPX, resolve_INV, resolve_CNV, cytobands,disc_pairs, 
-                          mei_bed,variant_prefix='CPX_', min_rescan_support=4, 
+                          mei_index,variant_prefix='CPX_', min_rescan_support=4, 
                           pe_blacklist=None, quiet=False, SR_only_cutoff=1000):
     #resolve_CPX = [i for i in out_rec if i.info['SVTYPE']=='CPX']
     #resolve_INV = [i for i in out_rec if i.info['SVTYPE']=='INV']
@@ -348,20 +344,20 @@ def resolve_complex_sv_v2(resolve_CPX, resolve_INV, resolve_CNV, cytobands,disc_
         # if cxsv overlap pulled in unrelated insertions, keep them separate
         if all([r.info['SVTYPE'] == 'INS' for r in cluster]):
             for record in cluster:
-                cpx = ComplexSV([record], cytobands, mei_bed, SR_only_cutoff)
-                cpx_record_ids = cpx_record_ids.union(cpx.record_ids)
+                cpx = ComplexSV([record], cytobands, mei_index, SR_only_cutoff)
+                cpx_record_ids_v2.update(cpx.record_ids)
                 
                 # Assign random string as resolved ID to handle sharding
-                cpx.vcf_record.id = variant_prefix + '_' + ''.join(random.choice(string.ascii_uppercase + string.digits) for _ in range(10))
-                cpx_records.append(cpx.vcf_record)
+                cpx.vcf_record.id = variant_prefix + '_' + _random_id()
+                cpx_records_v2.append(cpx.vcf_record)
                 # resolved_idx += 1
             outcome = 'treated as separate unrelated insertions'
         else:
-            cpx = ComplexSV(cluster, cytobands, mei_bed, SR_only_cutoff)
-            cpx_record_ids_v2 = cpx_record_ids_v2.union(cpx.record_ids)
+            cpx = ComplexSV(cluster, cytobands, mei_index, SR_only_cutoff)
+            cpx_record_ids_v2.update(cpx.record_ids)
             if cpx.svtype == 'UNR':
                 # Assign random string as unresolved ID to handle sharding
-                unresolved_vid = 'UNRESOLVED_' + ''.join(random.choice(string.ascii_uppercase + string.digits) for _ in range(10))
+                unresolved_vid = 'UNRESOLVED_' + _random_id()
                 for i, record in enumerate(cpx.records):
                     record.info['EVENT'] = unresolved_vid
                     record.info['UNRESOLVED'] = True
@@ -369,7 +365,7 @@ def resolve_complex_sv_v2(resolve_CPX, resolve_INV, resolve_CNV, cytobands,disc_
                 # unresolved_idx += 1
                 outcome = 'is unresolved'
             else:
-                cpx.vcf_record.id = variant_prefix + '_' + ''.join(random.choice(string.ascii_uppercase + string.digits) for _ in range(10))
+                cpx.vcf_record.id = variant_prefix + '_' + _random_id()
                 cpx_records_v2.append(cpx.vcf_record)
                 if 'CPX_TYPE' in cpx.vcf_record.info.keys():
                     outcome = 'resolved as ' + str(cpx.vcf_record.info['CPX_TYPE'])
@@ -453,9 +449,10 @@ def main(argv):
     resolved_f = pysam.VariantFile(resolved_pipe.stdin, 'w', header=vcf.header)
     unresolved_f = pysam.VariantFile(args.unresolved, 'w', header=vcf.header)
 
-    cytobands = pysam.TabixFile(args.cytobands)
+    cytobands = make_cytoband_index(pysam.TabixFile(args.cytobands))
 
-    mei_bed = pbt.BedTool(args.mei_bed)
+    # Index MEIs once so each candidate insertion is a direct lookup
+    mei_index = make_mei_index(pbt.BedTool(args.mei_bed))
     if args.pe_blacklist is not None:
         blacklist = pysam.TabixFile(args.pe_blacklist)
     else:
@@ -478,7 +475,7 @@ def main(argv):
     resolve_INV=[]
     cpx_dist=20000
 
-    for record in resolve_complex_sv(vcf, cytobands, disc_pairs, mei_bed, args.prefix, 
+    for record in resolve_complex_sv(vcf, cytobands, disc_pairs, mei_index, args.prefix, 
                                      args.min_rescan_pe_support, blacklist, args.quiet):
         #Move members to existing variant IDs unless variant is complex
         if record.info['SVTYPE'] != 'CPX' and args.prefix not in record.id:
@@ -495,7 +492,7 @@ def main(argv):
         else:
             resolved_records.append(record)
 
-    #out_rec = resolve_complex_sv(vcf, cytobands, disc_pairs, mei_bed, args.prefix, args.min_rescan_pe_support, blacklist)
+    #out_rec = resolve_complex_sv(vcf, cytobands, disc_pairs, mei_index, args.prefix, args.min_rescan_pe_support, blacklist)
     #Print status
     if not args.quiet:
         now = datetime.datetime.now()
@@ -508,7 +505,7 @@ def main(argv):
     resolve_CPX = []
     resolve_CNV = []
     cpx_records_v2 = resolve_complex_sv_v2(resolve_CPX, resolve_INV, resolve_CNV, 
-                                           cytobands, disc_pairs, mei_bed, args.prefix, 
+                                           cytobands, disc_pairs, mei_index, args.prefix, 
                                            args.min_rescan_pe_support, blacklist, args.quiet)
 
     for record in cpx_records_v2:
@@ -66,10 +66,11 @@ def main(argv):
                 'svtk', 'data/no_contigs_template.vcf')
         template = VariantFile(template)
         header = template.header
-        contig_line = '##contig=<ID={contig},length={length}>'
+        add_line = header.add_line
+        contig_line = '##contig=<ID={0},length={1}>'.format
         for line in args.contigs:
-            contig, length = line.split()[:2]
-            header.add_line(contig_line.format(**locals()))
+            contig, length = line.split(None, 2)[:2]
+            add_line(contig_line(contig, length))
     # Use GRCh37 by default
     else:
         template = pkg_resources.resource_filename(
@@ -96,8 +97,9 @@ def main(argv):
             args.source, vcf, fout, args.prefix, args.min_size,
             args.include_reference_sites, args.call_null_sites)
 
+    write = fout.write
     for record in standardizer.standardize_vcf():
-        fout.write(record)
+        write(record)
 
     fout.close()
     vcf.close()
@@ -17,11 +17,18 @@ maximum individual clustering distance across the libraries being analyzed.
 
 import argparse
 import os
+import shutil
 import sys
+import tempfile
+import threading
 from collections import deque
+from multiprocessing import Pool
+from queue import Queue
 from pysam import VariantFile, TabixFile
 
 from svtk.vcfcluster import VCFCluster
+from svtk.genomeslink import GSNode
+from svtk.utils import chrom_sort_key
 
 
 def flatten_pos(records, name, fout):
@@ -65,6 +72,128 @@ def parse_filepaths(filepaths):
     return vcfs
 
 
+def cluster_contig(task):
+    """
+    Cluster the records on one contig in a worker process.
+
+    Parameters
+    ----------
+    task : tuple
+        (filepaths, contig, blacklist path or None, VCFCluster kwargs,
+         directory for the temporary VCF)
+
+    Returns
+    -------
+    path : str
+        Temporary VCF of the contig's clustered records
+    """
+    filepaths, contig, blacklist, kwargs, tmpdir = task
+
+    # pysam handles can't be shared with the parent, so reopen everything
+    vcfs = parse_filepaths(filepaths)
+    if blacklist is not None:
+        blacklist = TabixFile(blacklist)
+
+    svc = VCFCluster(vcfs, region=contig, blacklist=blacklist, **kwargs)
+
+    fd, path = tempfile.mkstemp(suffix='.vcf', dir=tmpdir)
+    os.close(fd)
+    try:
+        fout = VariantFile(path, mode='w', header=svc.header)
+        for record in svc.cluster():
+            fout.write(record)
+        fout.close()
+    except:
+        os.remove(path)
+        raise
+
+    return path
+
+
+def cluster_by_contig(filepaths, vcfs, blacklist, kwargs, n_jobs):
+    """
+    Cluster each contig in parallel, yielding records in contig order.
+
+    Clusters never span more than one contig of their first breakpoint, so
+    this matches clustering the whole genome at once. Only contigs eligible
+    for clustering (see GSNode.is_allowed_chrom) are processed.
+    """
+    contigs = set(c for vcf in vcfs for c in vcf.header.contigs)
+    contigs = [c for c in contigs if GSNode(c, 0, c, 0).is_allowed_chrom()]
+    contigs = sorted(contigs, key=chrom_sort_key)
+
+    if blacklist is not None:
+        blacklist = blacklist.filename.decode('utf-8')
+
+    # Workers write to a private directory, so any contig VCFs left behind
+    # by a failed run (including results not yet received) are removed
+    tmpdir = tempfile.mkdtemp()
+    tasks = [(filepaths, contig, blacklist, kwargs, tmpdir)
+             for contig in contigs]
+
+    paths = []
+    try:
+        with Pool(n_jobs) as pool:
+            for path in pool.imap(cluster_contig, tasks):
+                paths.append(path)
+                with VariantFile(path) as vcf:
+                    for record in vcf:
+                        yield record
+                os.remove(path)
+    finally:
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def write_records(records, fout, maxsize=1024):
+    """
+    Write records from a background thread.
+
+    Formatting and compressing records is handed off to the writer thread
+    (pysam releases the GIL while writing), so clustering continues in the
+    meantime. Errors raised by the writer are re-raised here.
+
+    Parameters
+    ----------
+    records : iterable of pysam.VariantRecord
+    fout : pysam.VariantFile
+    maxsize : int, optional
+        Maximum number of records waiting to be written
+    """
+    queue = Queue(maxsize)
+    errors = []
+
+    def consume():
+        while True:
+            record = queue.get()
+            if record is None:
+                break
+
+            # Keep draining after an error so the producer never blocks
+            if not errors:
+                try:
+                    fout.write(record)
+                except Exception as e:
+                    errors.append(e)
+
+    writer = threading.Thread(target=consume)
+    writer.start()
+
+    try:
+        for record in records:
+            if errors:
+                break
+            queue.put(record)
+    finally:
+        queue.put(None)
+        writer.join()
+
+    if errors:
+        raise errors[0]
+
+
 def main(argv):
     parser = argparse.ArgumentParser(
         description=__doc__,
@@ -112,6 +241,13 @@ def main(argv):
     parser.add_argument('--preserve-header', action='store_true',
                         default=False,
                         help='Use header from clustering VCFs')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Number of processes to use when clustering '
+                        'all regions. Each contig is clustered separately '
+                        'and input VCFs must be tabix indexed. [1]')
+    parser.add_argument('--threads', type=int, default=1,
+                        help='Number of threads used to compress output '
+                        'when writing a .gz file. [1]')
     #  parser.add_argument('--cluster-bed', type=argparse.FileType('w'),
     #                      help='Bed of constituent calls in each cluster')
 
@@ -128,42 +264,55 @@ def main(argv):
     svtypes = args.svtypes.split(',')
     match_svtypes = not args.ignore_svtypes
 
-    svc = VCFCluster(vcfs, dist=args.dist, blacklist=args.blacklist,
-                     frac=args.frac, svtypes=svtypes, region=args.region,
-                     match_svtypes=match_svtypes,
-                     preserve_ids=args.preserve_ids,
-                     preserve_genotypes=args.preserve_genotypes,
-                     sample_overlap=args.sample_overlap,
-                     preserve_header=args.preserve_header)
+    kwargs = dict(dist=args.dist, frac=args.frac, svtypes=svtypes,
+                  match_svtypes=match_svtypes,
+                  preserve_ids=args.preserve_ids,
+                  preserve_genotypes=args.preserve_genotypes,
+                  sample_overlap=args.sample_overlap,
+                  preserve_header=args.preserve_header)
+
+    svc = VCFCluster(vcfs, blacklist=args.blacklist, region=args.region,
+                     **kwargs)
+
+    if args.jobs > 1 and args.region is None:
+        # Every contig shares the samples and sources found here
+        kwargs['sorted_samples'] = svc.samples
+        kwargs['sorted_sources'] = svc.sources
+        records = cluster_by_contig(filepaths, vcfs, args.blacklist, kwargs,
+                                    args.jobs)
+    else:
+        records = svc.cluster()
 
-    # Open new file
+    # Open new file, compressing with htslib threads if requested
     if args.fout in '- stdout'.split():
-        fout = sys.stdout
+        fout = VariantFile(sys.stdout, mode='w', header=svc.header)
+    elif args.fout.endswith('.gz'):
+        fout = VariantFile(args.fout, mode='wz', header=svc.header,
+                           threads=args.threads)
     else:
-        fout = open(args.fout, 'w')
-
-    fout = VariantFile(fout, mode='w', header=svc.header)
-
-    for i, record in enumerate(svc.cluster()):
-        # Name record
-        if args.prefix:
-            name = [args.prefix]
-        else:
-            name = ['SV']
-        if args.region:
-            chrom = args.region.split(':')[0]
-            name.append(chrom)
-        name.append(str(i + 1))
-        record.id = '_'.join(name)
-
-        fout.write(record)
-
-        # Size filter (CTX have size -1)
-        if -1 < record.info['SVLEN'] < args.svsize:
-            continue
-
-        #  if args.cluster_bed is not None:
-            #  flatten_pos(cluster, record.ID, args.cluster_bed)
+        fout = VariantFile(open(args.fout, 'w'), mode='w',
+                           header=svc.header)
+
+    def name_records(records):
+        for i, record in enumerate(records):
+            # Name record
+            if args.prefix:
+                name = [args.prefix]
+            else:
+                name = ['SV']
+            if args.region:
+                chrom = args.region.split(':')[0]
+                name.append(chrom)
+            name.append(str(i + 1))
+            record.id = '_'.join(name)
+
+            yield record
+
+            #  if args.cluster_bed is not None:
+                #  flatten_pos(cluster, record.ID, args.cluster_bed)
+
+    # Write from a background thread while clustering continues
+    write_records(name_records(records), fout)
 
     fout.close()
 
@@ -1,4 +1,4 @@
 from .cpx_link import link_cpx
 from .cpx_link import link_cpx_V2
-from .complex_sv import ComplexSV
+from .complex_sv import ComplexSV, make_cytoband_index, make_mei_index
 from .rescan_single_enders import rescan_single_ender
@@ -8,28 +8,60 @@
 Resolve clustered records into a complex SV
 """
 
-import numpy as np
-import pybedtools as pbt
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from functools import partial
 import svtk.utils as svu
 from .cpx_inv import classify_complex_inversion
 from .cpx_tloc import classify_simple_translocation, classify_insertion
 
 
+# Complex interval string, e.g. DUP_chr1:1000-2000
+_format_interval = '{0}_{1}:{2}-{3}'.format
+
+# Cluster types resolved after SR-only breakpoints are removed
+SECOND_PASS_CLUSTER_TYPES = frozenset([
+    'CANDIDATE_INVERSION', 'CANDIDATE_TRANSLOCATION',
+    'CANDIDATE_INSERTION', 'RESOLVED_INSERTION',
+])
+
+# Symbolic ALT tuples, shared across records
+_SYMBOLIC_ALTS = {svtype: ('<{0}>'.format(svtype), )
+                  for svtype in 'DEL DUP INV INS CTX CPX UNR'.split()}
+
+
+def symbolic_alts(svtype):
+    alts = _SYMBOLIC_ALTS.get(svtype)
+    if alts is None:
+        alts = _SYMBOLIC_ALTS[svtype] = ('<{0}>'.format(svtype), )
+    return alts
+
+
+def _is_SR_only(record):
+    return record.info.get('EVIDENCE', None) == ('SR', )
+
+
 class ComplexSV:
-    def __init__(self, records, cytobands, mei_bed, SR_only_cutoff):
+    __slots__ = ('records', 'cytobands', 'mei_index', 'inversions', 'tlocs',
+                 'breakends', 'insertions', 'cnvs', 'dels', 'dups',
+                 'vcf_record', 'cluster_type', 'svtype', 'cpx_type')
+
+    def __init__(self, records, cytobands, mei_index, SR_only_cutoff):
         """
         Parameters
         ----------
         records : list of pysam.VariantRecord
             Clustered records to resolve
-        cytobands : pysam.TabixFile
-            Cytoband bed file (to classify interchromosomal)
-        mei_bed : pybedtools.BedTool
+        cytobands : dict
+            Cytobands indexed by make_cytoband_index() (to classify
+            interchromosomal)
+        mei_index : dict
+            MEI intervals indexed by make_mei_index()
         """
 
         self.records = records
         self.cytobands = cytobands
-        self.mei_bed = mei_bed
+        self.mei_index = mei_index
         #  self.rdtest = rdtest
 
         self.organize_records()
@@ -39,118 +71,119 @@ class ComplexSV:
         self.clean_record()
 
     def organize_records(self):
-        self.inversions = [r for r in self.records if r.info['SVTYPE'] == 'INV']
-        self.tlocs = [r for r in self.records if r.chrom != r.info['CHR2']]
-        self.breakends = [r for r in self.records if (r.chrom == r.info['CHR2']) and
-                                                (r.info['SVTYPE'] == 'BND')]
-        self.insertions = [r for r in self.records if r.info['SVTYPE'] == 'INS']
-
-        cnvtypes = 'DEL DUP'.split()
-        self.cnvs = [r for r in self.records if r.info['SVTYPE'] in cnvtypes]
-        self.dels = [r for r in self.records if r.info['SVTYPE'] == 'DEL']
-        self.dups = [r for r in self.records if r.info['SVTYPE'] == 'DUP']
+        self.inversions = []
+        self.tlocs = []
+        self.breakends = []
+        self.insertions = []
+        self.cnvs = []
+        self.dels = []
+        self.dups = []
+
+        # Single pass so each record's INFO is only unpacked once
+        for r in self.records:
+            svtype = r.info['SVTYPE']
+            if r.chrom != r.info['CHR2']:
+                self.tlocs.append(r)
+            elif svtype == 'BND':
+                self.breakends.append(r)
+
+            if svtype == 'INV':
+                self.inversions.append(r)
+            elif svtype == 'INS':
+                self.insertions.append(r)
+            elif svtype == 'DEL':
+                self.cnvs.append(r)
+                self.dels.append(r)
+            elif svtype == 'DUP':
+                self.cnvs.append(r)
+                self.dups.append(r)
 
     def remove_SR_only_breakpoints(self):
-        def _is_SR_only(record):
-            return record.info.get('EVIDENCE', None) == ('SR', )
+        """
+        Drop SR-only records, unless every record in the cluster is SR-only.
 
+        Returns
+        -------
+        removed : bool
+            True if any records were removed from the cluster
+        """
         if 'EVIDENCE' in self.records[0].header.info.keys():
             clean_records = [r for r in self.records if not _is_SR_only(r)]
-            if len(clean_records) > 0:
+            if 0 < len(clean_records) < len(self.records):
                 self.records = clean_records
+                return True
+
+        return False
 
     def resolve(self, SR_only_cutoff):
-        self.set_cluster_type()
+        resolvers = {
+            'CANDIDATE_INVERSION': partial(self.resolve_candidate_inversion,
+                                           SR_only_cutoff),
+            'CANDIDATE_TRANSLOCATION': self.resolve_translocation,
+            'CANDIDATE_INSERTION': self.resolve_insertion,
+            'RESOLVED_INSERTION': self.report_simple_insertion,
+            'SINGLE_INSERTION_STRIP_CNVS': self.report_insertion_strip_CNVs,
+            'TANDEM_DUPLICATION_FLANKING_INSERTIONS': self.report_manta_tandem_dup,
+        }
 
-        if self.cluster_type == 'CANDIDATE_INVERSION':
-            self.resolve_inversion(SR_only_cutoff=SR_only_cutoff)
-            if self.svtype == 'UNR':
-                self.set_unresolved()
-                self.vcf_record.info['SVTYPE'] = 'BND'
-                self.vcf_record.info['UNRESOLVED_TYPE'] = 'SR_ONLY_LARGE_INVERSION'
-                self.cluster_type = 'SR_ONLY_LARGE_INVERSION'
-                for r in self.records:
-                    r.info['UNRESOLVED'] = True
-                    r.info['UNRESOLVED_TYPE'] = 'SR_ONLY_LARGE_INVERSION'
-                    r.info['SVTYPE'] = 'BND'
-                    if 'CPX_TYPE' in r.info.keys():
-                        r.info.pop('CPX_TYPE')
-                    if 'CPX_INTERVALS' in r.info.keys():
-                        r.info.pop('CPX_INTERVALS')
-        elif self.cluster_type == 'CANDIDATE_TRANSLOCATION':
-            self.resolve_translocation()
-        elif self.cluster_type == 'CANDIDATE_INSERTION':
-            self.resolve_insertion()
-        elif self.cluster_type == 'RESOLVED_INSERTION':
-            self.report_simple_insertion()
-        elif self.cluster_type == 'SINGLE_INSERTION_STRIP_CNVS':
-            self.report_insertion_strip_CNVs()
-        elif self.cluster_type == 'TANDEM_DUPLICATION_FLANKING_INSERTIONS':
-            self.report_manta_tandem_dup()
+        self.set_cluster_type()
+        if self.cluster_type in resolvers:
+            resolvers[self.cluster_type]()
+            return
 
         #Second pass through the record after excluding SR-only breakpoints 
         # if first pass is unsuccessful
+
+        #Collect SR-only records that are not remaining in existing cluster
+        #Note: if the cluster only had a single breakpoint to begin with, 
+        # it will not be removed by .remove_SR_only_breakpoints(), even if
+        # it is SR only. The below code is necessary to prevent duplicating
+        # SR-only single-enders
+        non_sr_only_rec_ids = set(r.id for r in self.records
+                                  if not _is_SR_only(r))
+        if len(non_sr_only_rec_ids) > 0:
+            sr_only_recs = [r for r in self.records if _is_SR_only(r) and
+                            r.id not in non_sr_only_rec_ids]
         else:
-            #Collect SR-only records that are not remaining in existing cluster
-            #Note: if the cluster only had a single breakpoint to begin with, 
-            # it will not be removed by .remove_SR_only_breakpoints(), even if
-            # it is SR only. The below code is necessary to prevent duplicating
-            # SR-only single-enders
-            def _is_SR_only(record):
-                return record.info.get('EVIDENCE', None) == ('SR', )
-            non_sr_only_rec_ids = [r.id for r in self.records if not _is_SR_only(r)]
-            if len(non_sr_only_rec_ids) > 0:
-                sr_only_recs = [r for r in self.records if _is_SR_only(r) and r.id not in non_sr_only_rec_ids]
-            else:
-                sr_only_recs = []
+            sr_only_recs = []
 
-            self.remove_SR_only_breakpoints()
+        # Only reclassify if removing SR-only records changed the cluster
+        if self.remove_SR_only_breakpoints():
             self.organize_records()
             self.set_cluster_type()
-
-            if self.cluster_type in 'CANDIDATE_INVERSION CANDIDATE_TRANSLOCATION '.split() + \
-                'CANDIDATE_INSERTION RESOLVED_INSERTION'.split() \
-            and len(self.records) > 0:
-                if self.cluster_type == 'CANDIDATE_INVERSION':
-                    self.resolve_inversion(SR_only_cutoff=SR_only_cutoff)
-                    if self.svtype == 'UNR':
-                        self.set_unresolved()
-                        self.vcf_record.info['SVTYPE'] = 'BND'
-                        self.vcf_record.info['UNRESOLVED_TYPE'] = 'SR_ONLY_LARGE_INVERSION'
-                        self.cluster_type = 'SR_ONLY_LARGE_INVERSION'
-                        for r in self.records:
-                            r.info['UNRESOLVED'] = True
-                            r.info['UNRESOLVED_TYPE'] = 'SR_ONLY_LARGE_INVERSION'
-                            r.info['SVTYPE'] = 'BND'
-                            if 'CPX_TYPE' in r.info.keys():
-                                r.info.pop('CPX_TYPE')
-                            if 'CPX_INTERVALS' in r.info.keys():
-                                r.info.pop('CPX_INTERVALS')
-                elif self.cluster_type == 'CANDIDATE_TRANSLOCATION':
-                    self.resolve_translocation()
-                elif self.cluster_type == 'CANDIDATE_INSERTION':
-                    self.resolve_insertion()
-                elif self.cluster_type == 'RESOLVED_INSERTION':
-                    self.report_simple_insertion()
-
-            else:
-                #Add back SR-only records if cluster is still unresolved, 
-                # and if SR-only record doesnt match only existing cluster
-                if len(sr_only_recs) > 0:
-                    for r in sr_only_recs:
-                        self.records.append(r)
-                self.organize_records()
-                self.set_cluster_type()
-                self.set_unresolved()
-
-                if self.cluster_type == 'SINGLE_ENDER':
-                    self.vcf_record.info['SVTYPE'] = 'BND'
-                if self.cluster_type == 'INVERSION_SINGLE_ENDER':
-                    self.vcf_record.info['SVTYPE'] = 'BND'
-                for r in self.records:
-                    r.info['UNRESOLVED'] = True
-                    r.info['UNRESOLVED_TYPE'] = self.cpx_type
-
+            if self.cluster_type in SECOND_PASS_CLUSTER_TYPES:
+                resolvers[self.cluster_type]()
+                return
+
+        #Add back SR-only records if cluster is still unresolved, 
+        # and if SR-only record doesnt match only existing cluster
+        if len(sr_only_recs) > 0:
+            self.records.extend(sr_only_recs)
+            self.organize_records()
+            self.set_cluster_type()
+        self.set_unresolved()
+
+        if self.cluster_type == 'SINGLE_ENDER':
+            self.vcf_record.info['SVTYPE'] = 'BND'
+        if self.cluster_type == 'INVERSION_SINGLE_ENDER':
+            self.vcf_record.info['SVTYPE'] = 'BND'
+        for r in self.records:
+            r.info['UNRESOLVED'] = True
+            r.info['UNRESOLVED_TYPE'] = self.cpx_type
+
+    def resolve_candidate_inversion(self, SR_only_cutoff):
+        self.resolve_inversion(SR_only_cutoff=SR_only_cutoff)
+        if self.svtype == 'UNR':
+            self.set_unresolved()
+            self.vcf_record.info['SVTYPE'] = 'BND'
+            self.vcf_record.info['UNRESOLVED_TYPE'] = 'SR_ONLY_LARGE_INVERSION'
+            self.cluster_type = 'SR_ONLY_LARGE_INVERSION'
+            for r in self.records:
+                r.info['UNRESOLVED'] = True
+                r.info['UNRESOLVED_TYPE'] = 'SR_ONLY_LARGE_INVERSION'
+                r.info['SVTYPE'] = 'BND'
+                r.info.pop('CPX_TYPE', None)
+                r.info.pop('CPX_INTERVALS', None)
 
     def clean_record(self):
         """
@@ -203,23 +236,25 @@ class ComplexSV:
         else:
             self.svtype = 'CPX'
 
+        # Overall variant start/end
+        start = min(FF.pos, RR.pos)
+        end = max(FF.stop, RR.stop)
+
         # If event is >1kb and both breakpoints are SR-only,
         # leave variant as unresolved
-        if 'EVIDENCE' in FF.info.keys() and 'EVIDENCE' in RR.info.keys():
-            if FF.info['EVIDENCE'] == ('SR',) and RR.info['EVIDENCE'] == ('SR',):
-                if max(FF.stop, RR.stop) - min(FF.pos, RR.pos) > SR_only_cutoff:
-                    self.cpx_type = 'UNK'
-                    self.svtype = 'UNR'
+        if (FF.info.get('EVIDENCE') == ('SR',) and
+                RR.info.get('EVIDENCE') == ('SR',)):
+            if end - start > SR_only_cutoff:
+                self.cpx_type = 'UNK'
+                self.svtype = 'UNR'
 
-        # Overall variant start/end
         if self.svtype in ['INV', 'CPX', 'UNR']:
-            self.vcf_record.pos = min(FF.pos, RR.pos)
-            self.vcf_record.stop = max(FF.stop, RR.stop)
+            self.vcf_record.pos = start
+            self.vcf_record.stop = end
 
-            self.vcf_record.info['SVLEN'] = abs(self.vcf_record.stop -
-                                                self.vcf_record.pos)
+            self.vcf_record.info['SVLEN'] = abs(end - start)
 
-            if self.svtype is not 'UNR':
+            if self.svtype != 'UNR':
                 cpx_intervals = make_inversion_intervals(FF, RR, self.cnvs,
                                                          self.cpx_type)
                 self.vcf_record.info['CPX_INTERVALS'] = cpx_intervals
@@ -239,7 +274,7 @@ class ComplexSV:
 
             # first check for overlap with MEI
             is_mei = check_mei_overlap(self.vcf_record.chrom, source_start,
-                                       source_end, self.mei_bed)
+                                       source_end, self.mei_index)
 
             # then check for RdTest support
             #  is_dup = check_rdtest(self.vcf_record, source_start, source_end,
@@ -259,31 +294,35 @@ class ComplexSV:
             # As in MELT, use length of inserted sequence as SVLEN
             self.vcf_record.info['SVLEN'] = abs(source_end - source_start)
 
-            interval = 'INV_{0}:{1}-{2}'
-            source = interval.format(self.vcf_record.chrom,
-                                     source_start, source_end)
+            source = _format_interval('INV', self.vcf_record.chrom,
+                                      source_start, source_end)
             self.vcf_record.info['SOURCE'] = source
 
         # Setting alts removes END, so do it up front
-        self.vcf_record.alts = ('<{0}>'.format(self.svtype), )
+        self.vcf_record.alts = symbolic_alts(self.svtype)
         self.vcf_record.info['SVTYPE'] = self.svtype
         self.vcf_record.info['CPX_TYPE'] = self.cpx_type
 
 
     def resolve_translocation(self):
         # Force to ++/-- or +-/-+ ordering
-        plus, minus = sorted(self.tlocs, key=lambda t: t.info['STRANDS'])
+        plus, minus = order_by_strands(*self.tlocs)
         armA, armB = get_arms(plus, self.cytobands)
         
         self.cpx_type = classify_simple_translocation(plus, minus)
 
+        plus_chrom, plus_chr2 = plus.chrom, plus.info['CHR2']
+        plus_pos, plus_stop = plus.pos, plus.stop
+        minus_pos, minus_stop = minus.pos, minus.stop
+        same_coords = plus_pos == minus_pos and plus_stop == minus_stop
+
         if 'INS' in self.cpx_type:
             self.svtype = 'INS'
         elif self.cpx_type in ['TLOC_MISMATCH_CHROM', 'CTX_UNR']:
             self.svtype = 'UNR'
         elif self.cpx_type == 'CTX_PP/QQ':
             # Don't report sites where posA/posB are identical at each bkpt
-            if plus.pos == minus.pos and plus.stop == minus.stop:
+            if same_coords:
                 self.svtype = 'UNR'
                 self.cpx_type += '_DUPLICATE_COORDS'
             elif armA == armB:
@@ -292,7 +331,7 @@ class ComplexSV:
                 self.svtype = 'UNR'
                 self.cpx_type += '_MISMATCH'
         elif self.cpx_type == 'CTX_PQ/QP':
-            if plus.pos == minus.pos and plus.stop == minus.stop:
+            if same_coords:
                 self.svtype = 'UNR'
                 self.cpx_type += '_DUPLICATE_COORDS'
             elif armA != armB:
@@ -304,43 +343,43 @@ class ComplexSV:
             raise Exception('Invalid cpx type: ' + self.cpx_type)
 
         # Setting alts removes END, so do it up front
-        self.vcf_record.alts = ('<{0}>'.format(self.svtype), )
+        self.vcf_record.alts = symbolic_alts(self.svtype)
         self.vcf_record.info['SVTYPE'] = self.svtype
         self.vcf_record.info['CPX_TYPE'] = self.cpx_type
 
         if self.svtype == 'CTX':
-            self.vcf_record.chrom = plus.chrom
-            self.vcf_record.pos = plus.pos
-            self.vcf_record.info['CHR2'] = plus.info['CHR2']
-            self.vcf_record.stop = plus.stop
+            self.vcf_record.chrom = plus_chrom
+            self.vcf_record.pos = plus_pos
+            self.vcf_record.info['CHR2'] = plus_chr2
+            self.vcf_record.stop = plus_stop
             self.vcf_record.info['SVLEN'] = -1
 
         elif self.svtype == 'INS':
             if 'B2A' in self.cpx_type:
-                sink_chrom, source_chrom = plus.chrom, plus.info['CHR2']
+                sink_chrom, source_chrom = plus_chrom, plus_chr2
             else:
-                sink_chrom, source_chrom = plus.info['CHR2'], plus.chrom
+                sink_chrom, source_chrom = plus_chr2, plus_chrom
 
             if self.cpx_type == 'CTX_INS_B2A':
-                sink_start = plus.pos
-                sink_end = minus.pos
-                source_start = plus.stop
-                source_end = minus.stop
+                sink_start = plus_pos
+                sink_end = minus_pos
+                source_start = plus_stop
+                source_end = minus_stop
             elif self.cpx_type == 'CTX_INV_INS_B2A':
-                sink_start = plus.pos
-                sink_end = minus.pos
-                source_start = minus.stop
-                source_end = plus.stop
+                sink_start = plus_pos
+                sink_end = minus_pos
+                source_start = minus_stop
+                source_end = plus_stop
             elif self.cpx_type == 'CTX_INS_A2B':
-                sink_start = minus.stop
-                sink_end = plus.stop
-                source_start = minus.pos
-                source_end = plus.pos
+                sink_start = minus_stop
+                sink_end = plus_stop
+                source_start = minus_pos
+                source_end = plus_pos
             elif self.cpx_type == 'CTX_INV_INS_A2B':
-                sink_start = plus.stop
-                sink_end = minus.stop
-                source_start = minus.pos
-                source_end = plus.pos
+                sink_start = plus_stop
+                sink_end = minus_stop
+                source_start = minus_pos
+                source_end = plus_pos
 
             self.vcf_record.chrom = sink_chrom
             self.vcf_record.pos = sink_start
@@ -349,18 +388,17 @@ class ComplexSV:
             self.vcf_record.info['CHR2'] = source_chrom
             self.vcf_record.info['SVLEN'] = abs(source_end - source_start)
 
-            interval = '{0}_{1}:{2}-{3}'
             if 'INV' in self.cpx_type:
                 interval_type = 'INV'
             else:
                 interval_type = 'INS'
 
-            source = interval.format(interval_type, source_chrom,
-                                     source_start, source_end)
+            source = _format_interval(interval_type, source_chrom,
+                                      source_start, source_end)
             self.vcf_record.info['SOURCE'] = source
 
     def resolve_insertion(self):
-        plus, minus = sorted(self.breakends, key=lambda t: t.info['STRANDS'])
+        plus, minus = order_by_strands(*self.breakends)
         self.cpx_type = classify_insertion(plus, minus)
 
         if self.cpx_type == 'INS_UNCLASSIFIED':
@@ -370,23 +408,24 @@ class ComplexSV:
             self.svtype = 'INS'
 
         # Setting alts removes END, so do it up front
-        self.vcf_record.alts = ('<{0}>'.format(self.svtype), )
+        self.vcf_record.alts = symbolic_alts(self.svtype)
         self.vcf_record.info['SVTYPE'] = self.svtype
         self.vcf_record.info['CPX_TYPE'] = self.cpx_type
 
-        sink_chrom = plus.chrom
-        source_chrom = plus.chrom
+        sink_chrom = source_chrom = plus.chrom
+        plus_pos, plus_stop = plus.pos, plus.stop
+        minus_pos, minus_stop = minus.pos, minus.stop
 
         if self.cpx_type == 'INS_B2A':
-            sink_start = plus.pos
-            sink_end = minus.pos
-            source_start = plus.stop
-            source_end = minus.stop
+            sink_start = plus_pos
+            sink_end = minus_pos
+            source_start = plus_stop
+            source_end = minus_stop
         elif self.cpx_type == 'INS_A2B':
-            sink_start = minus.stop
-            sink_end = plus.stop
-            source_start = minus.pos
-            source_end = plus.pos
+            sink_start = minus_stop
+            sink_end = plus_stop
+            source_start = minus_pos
+            source_end = plus_pos
 
         # RLC Note: no longer need this code, as this will now be handled in 
         # the complex regenotyping WDL
@@ -402,8 +441,8 @@ class ComplexSV:
         self.vcf_record.info['CHR2'] = source_chrom
         self.vcf_record.info['SVLEN'] = abs(source_end - source_start)
 
-        interval = 'INS_{0}:{1}-{2}'
-        source = interval.format(source_chrom, source_start, source_end)
+        source = _format_interval('INS', source_chrom,
+                                  source_start, source_end)
         self.vcf_record.info['SOURCE'] = source
 
         if len(self.insertions) == 1:
@@ -556,12 +595,12 @@ class ComplexSV:
         class_counts = [len(records) for records in 
                         [self.inversions, self.tlocs, self.breakends, self.insertions]]
 
-        paired = np.array([count == 2 for count in class_counts])
-        absent = np.array([count == 0 for count in class_counts])
+        paired = [i for i, count in enumerate(class_counts) if count == 2]
+        present = [i for i, count in enumerate(class_counts) if count != 0]
 
         # If one class is paired and rest are absent
-        if all(paired ^ absent) and len(np.where(paired)[0]) == 1 and len(self.cnvs) == 0:
-            idx = np.where(paired)[0][0]
+        if len(paired) == 1 and paired == present and len(self.cnvs) == 0:
+            idx = paired[0]
             if idx == 0:
                 if (self.inversions[0].info['STRANDS'] ==
                         self.inversions[1].info['STRANDS']):
@@ -618,84 +657,156 @@ class ComplexSV:
         svu.update_best_genotypes(self.vcf_record, self.records, preserve_multiallelic=False)
 
 
+def order_by_strands(rec1, rec2):
+    """Return a pair of records ordered by their STRANDS field"""
+    if rec2.info['STRANDS'] < rec1.info['STRANDS']:
+        return rec2, rec1
+    return rec1, rec2
+
+
+def _ordered_strands(rec1, rec2):
+    strand1, strand2 = rec1.info['STRANDS'], rec2.info['STRANDS']
+    if strand2 < strand1:
+        return strand2, strand1
+    return strand1, strand2
+
+
 def ok_tloc_strands(tloc1, tloc2):
-    strand1, strand2 = sorted([t.info['STRANDS'] for t in (tloc1, tloc2)])
+    strands = _ordered_strands(tloc1, tloc2)
 
-    return ((strand1 == '++' and strand2 == '--') or
-            (strand1 == '+-' and strand2 == '-+'))
+    return strands == ('++', '--') or strands == ('+-', '-+')
 
 
 def ok_ins_strands(bnd1, bnd2):
-    strand1, strand2 = sorted([t.info['STRANDS'] for t in (bnd1, bnd2)])
+    return _ordered_strands(bnd1, bnd2) == ('+-', '-+')
 
-    return (strand1 == '+-') and (strand2 == '-+')
 
+def make_cytoband_index(cytobands):
+    """
+    Load cytobands into sorted per-chromosome lists.
 
-def get_arms(record, cytobands):
-    regionA = '{0}:{1}-{1}'.format(record.chrom, record.pos)
-    regionB = '{0}:{1}-{1}'.format(record.info['CHR2'], record.stop)
+    Parameters
+    ----------
+    cytobands : pysam.TabixFile
+        Cytoband bed file
+
+    Returns
+    -------
+    cytoband_index : dict of {str: (list of int, list of int, list of str)}
+        Band starts, ends, and arms (p or q) on each chromosome
+    """
+    bands = defaultdict(list)
+    for line in cytobands.fetch():
+        chrom, start, end, band = line.split()[:4]
+        bands[chrom].append((int(start), int(end), band[0]))
+
+    cytoband_index = {}
+    for chrom, chrom_bands in bands.items():
+        chrom_bands.sort()
+        cytoband_index[chrom] = tuple(list(x) for x in zip(*chrom_bands))
+
+    return cytoband_index
 
-    def _get_arm(region):
-        arm = next(cytobands.fetch(region))
-        return arm.split()[3][0]
 
-    return _get_arm(regionA), _get_arm(regionB)
+def get_arm(chrom, pos, cytobands):
+    """
+    Chromosome arm of the band containing a 1-based position
+    """
+    starts, ends, arms = cytobands.get(chrom, ((), (), ()))
+
+    # Last band starting before the position
+    i = bisect_left(starts, pos) - 1
+    if i < 0 or ends[i] < pos:
+        msg = 'No cytoband contains {0}:{1}'.format(chrom, pos)
+        raise ValueError(msg)
+
+    return arms[i]
+
+
+def get_arms(record, cytobands):
+    return (get_arm(record.chrom, record.pos, cytobands),
+            get_arm(record.info['CHR2'], record.stop, cytobands))
 
 
 def make_inversion_intervals(FF, RR, cnvs, cpx_type):
     intervals = []
     chrom = FF.chrom
 
-    interval = '{svtype}_{chrom}:{start}-{end}'
-
     # First add 5' CNV
     if cpx_type.startswith('del'):
-        svtype = 'DEL'
-        start = FF.pos
-        end = RR.pos
-        intervals.append(interval.format(**locals()))
+        intervals.append(_format_interval('DEL', chrom, FF.pos, RR.pos))
 
     if cpx_type.startswith('dup'):
-        svtype = 'DUP'
-        start = RR.pos
-        end = FF.pos
-        intervals.append(interval.format(**locals()))
+        intervals.append(_format_interval('DUP', chrom, RR.pos, FF.pos))
 
     # Then add inversion
-    svtype = 'INV'
-    start = RR.pos
-    end = FF.stop
-    intervals.append(interval.format(**locals()))
+    intervals.append(_format_interval('INV', chrom, RR.pos, FF.stop))
 
     # Finally add 3' CNV
     if cpx_type.endswith('del'):
-        svtype = 'DEL'
-        start = FF.stop
-        end = RR.stop
-        intervals.append(interval.format(**locals()))
+        intervals.append(_format_interval('DEL', chrom, FF.stop, RR.stop))
 
     if cpx_type.endswith('dup'):
-        svtype = 'DUP'
-        start = RR.stop
-        end = FF.stop
-        intervals.append(interval.format(**locals()))
+        intervals.append(_format_interval('DUP', chrom, RR.stop, FF.stop))
 
     return intervals
 
 
-def check_mei_overlap(chrom, start, end, mei_bed):
+def make_mei_index(mei_bed):
     """
-    Check if putative insertion is covered by MEIs
+    Load MEI intervals into sorted, non-overlapping per-chromosome lists.
+
+    Parameters
+    ----------
+    mei_bed : pybedtools.BedTool
+
+    Returns
+    -------
+    mei_index : dict of {str: (list of int, list of int)}
+        Merged interval starts and ends on each chromosome
     """
+    intervals = defaultdict(list)
+    for interval in mei_bed:
+        intervals[interval.chrom].append((interval.start, interval.end))
+
+    mei_index = {}
+    for chrom, chrom_intervals in intervals.items():
+        starts, ends = [], []
+        for start, end in sorted(chrom_intervals):
+            if ends and start <= ends[-1]:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+        mei_index[chrom] = (starts, ends)
+
+    return mei_index
 
-    bedline = '{0}\t{1}\t{2}\n'.format(chrom, start, end)
-    bed = pbt.BedTool(bedline, from_string=True)
 
-    cov_bed = bed.coverage(mei_bed).saveas()
-    i = next(cov_bed.intervals)
-    cov = float(i.fields[6])
+def mei_coverage(chrom, start, end, mei_index):
+    """
+    Fraction of an interval covered by MEIs (as in `bedtools coverage`)
+    """
+    if end <= start or chrom not in mei_index:
+        return 0.0
 
-    return cov >= 0.5
+    starts, ends = mei_index[chrom]
+
+    # First merged MEI ending after the interval start
+    i = bisect_right(ends, start)
+    covered = 0
+    while i < len(starts) and starts[i] < end:
+        covered += min(ends[i], end) - max(starts[i], start)
+        i += 1
+
+    return covered / (end - start)
+
+
+def check_mei_overlap(chrom, start, end, mei_index):
+    """
+    Check if putative insertion is covered by MEIs
+    """
+    return mei_coverage(chrom, start, end, mei_index) >= 0.5
 
 
 def check_rdtest(record, start, end, rdtest):
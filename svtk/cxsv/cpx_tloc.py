@@ -9,6 +9,11 @@ Classification of reciprocal translocations.
 """
 
 
+def has_PE(record):
+    """Check for PE evidence"""
+    return 'PE' in record.info.get('EVIDENCE', ())
+
+
 def classify_insertion(plus, minus, mh_buffer=50):
     plus_A = plus.pos
     minus_A = minus.pos
@@ -16,12 +21,14 @@ def classify_insertion(plus, minus, mh_buffer=50):
     minus_B = minus.stop
 
     # Buffer comparisons
-    def _greater(p1, p2):
-        return p1 > p2 - mh_buffer
+    minus_A_greater = minus_A > plus_A - mh_buffer
+    plus_A_greater = plus_A > minus_A - mh_buffer
+    minus_B_greater = minus_B > plus_B - mh_buffer
+    plus_B_greater = plus_B > minus_B - mh_buffer
 
-    if _greater(minus_A, plus_A) and _greater(minus_B, plus_B):
+    if minus_A_greater and minus_B_greater:
         return 'INS_B2A'
-    elif _greater(plus_A, minus_A) and _greater(plus_B, minus_B):
+    elif plus_A_greater and plus_B_greater:
         return 'INS_A2B'
     else:
         return 'INS_UNCLASSIFIED'
@@ -65,40 +72,30 @@ def classify_simple_translocation(plus, minus, mh_buffer=10):
     plus_strands = plus.info['STRANDS']
 
     # Buffer comparisons
-    def _greater(p1, p2):
-        return p1 > p2 - mh_buffer
-
-    # Check for PE evidence
-    def _hasPE(recA, recB):
-        if 'EVIDENCE' in recA.info.keys() \
-        and 'EVIDENCE' in recB.info.keys():
-            if 'PE' in recA.info['EVIDENCE'] \
-            and 'PE' in recB.info['EVIDENCE']:
-                return True
-            else:
-                return False
-        else:
-            return False
+    minus_A_greater = minus_A > plus_A - mh_buffer
+    plus_A_greater = plus_A > minus_A - mh_buffer
+    minus_B_greater = minus_B > plus_B - mh_buffer
+    plus_B_greater = plus_B > minus_B - mh_buffer
 
     if plus_strands == '+-':
-        if _greater(minus_A, plus_A) and _greater(plus_B, minus_B):
-            if _hasPE(plus, minus):
+        if minus_A_greater and plus_B_greater:
+            if has_PE(plus) and has_PE(minus):
                 return 'CTX_PP/QQ'
             else:
                 return 'CTX_UNR'
-        if _greater(minus_A, plus_A) and _greater(minus_B, plus_B):
+        if minus_A_greater and minus_B_greater:
             return 'CTX_INS_B2A'
-        if _greater(plus_A, minus_A) and _greater(plus_B, minus_B):
+        if plus_A_greater and plus_B_greater:
             return 'CTX_INS_A2B'
     else:
-        if _greater(minus_A, plus_A) and _greater(minus_B, plus_B):
-            if _hasPE(plus, minus):
+        if minus_A_greater and minus_B_greater:
+            if has_PE(plus) and has_PE(minus):
                 return 'CTX_PQ/QP'
             else:
                 return 'CTX_UNR'
-        if _greater(minus_A, plus_A) and _greater(plus_B, minus_B):
+        if minus_A_greater and plus_B_greater:
             return 'CTX_INV_INS_B2A'
-        if _greater(plus_A, minus_A) and _greater(minus_B, plus_B):
+        if plus_A_greater and minus_B_greater:
             return 'CTX_INV_INS_A2B'
 
     return 'CTX_UNR'
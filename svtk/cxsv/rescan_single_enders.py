@@ -10,15 +10,22 @@
 
 import argparse
 import itertools
-from collections import defaultdict
+from collections import Counter
 import pysam
-from svtk.genomeslink import GenomeSLINK, GSNode
+from svtk.genomeslink import GenomeSLINK, GSNode, link_nodes
 import svtk.utils as svu
 from statistics import median
 import numpy as np
 import datetime
 
 class DiscPair(GSNode):
+    """
+    Discordant pair parsed from a tabix-indexed PE file line.
+
+    Coordinates are converted to int once by GSNode at construction.
+    """
+    __slots__ = ('strandA', 'strandB', 'sample')
+
     def __init__(self, chrA, posA, strandA, chrB, posB, strandB, sample):
         self.strandA = strandA
         self.strandB = strandB
@@ -35,6 +42,25 @@ class DiscPair(GSNode):
                         self.chrB, self.posB, self.strandB, self.sample)
 
 
+class DiscPairSLINK(GenomeSLINK):
+    """
+    Single-linkage clustering of discordant pairs.
+
+    DiscPairs use the default GSNode linkage criteria, so each candidate
+    batch can be linked with vectorized comparisons over its coordinates
+    rather than by testing every pair of nodes in Python.
+    """
+    def link_candidates(self, candidates):
+        n = len(candidates)
+        posA = np.fromiter((p.posA for p in candidates), dtype=np.int64,
+                           count=n)
+        posB = np.fromiter((p.posB for p in candidates), dtype=np.int64,
+                           count=n)
+        chrB = np.array([p.chrB for p in candidates])
+
+        return link_nodes(posA, chrB, posB, self.dist)
+
+
 def match_cluster(record, cluster, dist=300):
     """
     Determine whether DiscPair cluster matches a VCF record of interest.
@@ -55,26 +81,30 @@ def match_cluster(record, cluster, dist=300):
     """
     r_start, r_end = record.pos, record.stop
 
-    if record.info['STRANDS'] == '++':
-        # If no ++ pairs present, return False
-        if not any(p.strandA == '+' for p in cluster):
-            return False
-
-        # Otherwise choose max start/end of ++ pairs
-        c_start = max(p.posA for p in cluster if (p.strandA == '+'))
-        c_end = max(p.posB for p in cluster if (p.strandB == '+'))
-    elif record.info['STRANDS'] == '--':
-        # If no -- pairs present, return False
-        if not any(p.strandA == '-' for p in cluster):
-            return False
-
-        # Otherwise choose min start/end of -- pairs
-        c_start = min(p.posA for p in cluster if (p.strandA == '-'))
-        c_end = min(p.posB for p in cluster if (p.strandB == '-'))
+    strands = record.info['STRANDS']
+    if strands == '++':
+        # Choose max start/end of ++ pairs
+        strand, use_max = '+', True
+    elif strands == '--':
+        # Choose min start/end of -- pairs
+        strand, use_max = '-', False
     else:
-        strands = record.info['STRANDS']
         raise Exception('Invalid inversion orientation: {0}'.format(strands))
 
+    # Find extreme start/end of matching pairs in a single pass
+    c_start = c_end = None
+    for p in cluster:
+        if p.strandA == strand:
+            if c_start is None or (p.posA > c_start) == use_max:
+                c_start = p.posA
+        if p.strandB == strand:
+            if c_end is None or (p.posB > c_end) == use_max:
+                c_end = p.posB
+
+    # If no pairs match the record's strandedness, return False
+    if c_start is None or c_end is None:
+        return False
+
     # Test if cluster start/end are sufficiently close to record start/end
     return abs(r_start - c_start) < dist and abs(r_end - c_end) < dist
 
@@ -135,23 +165,28 @@ def rescan_single_ender(record, pe, min_support=4, window=1000, dist=300,
     search_end = max([0, record.pos + window])
     if search_end <= search_start:
         search_end = search_start + 1
-    pairs = pe.fetch('{0}:{1}-{2}'.format(record.chrom, search_start, search_end))
-    pairs = [DiscPair(*p.split()) for p in pairs]
+    region = '{0}:{1}-{2}'.format(record.chrom, search_start, search_end)
 
     # To protect against wasting time on particularly messy loci not captured 
     # in the blacklist, automatically fail site if total number of discordant 
     # pairs is > 2 * samples * min_support
     all_samples = record.samples.keys()
-    if len(pairs) > 2 * len(all_samples) * min_support:
-        return record, None
-
-    # Subset to only inversion pairs
-    pairs = [p for p in pairs if p.is_inversion]
+    max_pairs = 2 * len(all_samples) * min_support
+
+    # Subset to only inversion pairs (chrA == chrB, strandA == strandB) while
+    # streaming, deferring DiscPair construction until samples are selected
+    n_pairs = 0
+    inv_pairs = []
+    for line in pe.fetch(region):
+        n_pairs += 1
+        if n_pairs > max_pairs:
+            return record, None
+        fields = line.split()
+        if fields[0] == fields[3] and fields[2] == fields[5]:
+            inv_pairs.append(fields)
 
     # Count number of pairs per sample for all samples
-    sample_support_precluster = defaultdict(int)
-    for pair in pairs:
-        sample_support_precluster[pair.sample] += 1
+    sample_support_precluster = Counter(fields[6] for fields in inv_pairs)
     pairs_count_list = []
     for s in record.samples.keys():
         pairs_count_list.append(sample_support_precluster.get(s, 0))
@@ -159,7 +194,8 @@ def rescan_single_ender(record, pe, min_support=4, window=1000, dist=300,
     # If median number of pairs per sample not called in the original record
     # > min_support, fail record. Otherwise, keep going.
     called = svu.get_called_samples(record)
-    not_called = [s for s in all_samples if s not in called]
+    called_set = frozenset(called)
+    not_called = [s for s in all_samples if s not in called_set]
     if len(called) < len(all_samples):
         nocall_pairs_count_list = []
         for s in not_called:
@@ -171,10 +207,12 @@ def rescan_single_ender(record, pe, min_support=4, window=1000, dist=300,
     # Randomly subset pairs from all samples to max_samples
     np.random.seed(123456789)
     called_subset = np.random.choice(called, max_samples).tolist()
-    pairs = [p for p in pairs if p.sample in called_subset and p.is_inversion]
+    subset_samples = frozenset(called_subset)
+    pairs = [DiscPair(*fields) for fields in inv_pairs
+             if fields[6] in subset_samples]
 
     # Cluster pairs
-    slink = GenomeSLINK(pairs, dist, blacklist=pe_blacklist)
+    slink = DiscPairSLINK(pairs, dist, blacklist=pe_blacklist)
     clusters = [c for c in slink.cluster() if match_cluster(record, c, window)]
 
     # If no clusters, fail site, otherwise choose largest cluster
@@ -188,30 +226,30 @@ def rescan_single_ender(record, pe, min_support=4, window=1000, dist=300,
     supporting_pairs = [p for p in cluster if p.strandA == missing_strand]
 
     #Check span of supporting pairs from best cluster
-    minA = round(np.percentile([p.posA for p in cluster], 10))
-    maxA = round(np.percentile([p.posA for p in cluster], 90))
-    spanA = maxA - minA
-    
-    minB = round(np.percentile([p.posB for p in cluster], 10))
-    maxB = round(np.percentile([p.posB for p in cluster], 90))
-    spanB = maxB - minB
+    coords = pair_coords(cluster)
+    (minA, minB), (maxA, maxB) = np.percentile(coords, [10, 90], axis=0)
+    spanA = round(maxA) - round(minA)
+    spanB = round(maxB) - round(minB)
 
     if min([spanA, spanB]) < min_span:
         return record, None
 
     # Count number of supporting pairs in each called sample
-    sample_support = defaultdict(int)
-    for pair in supporting_pairs:
-        sample_support[pair.sample] += 1
+    sample_support = Counter(p.sample for p in supporting_pairs)
    
     # If enough samples were found to have support, make new variant record
-    n_supported_samples = sum(sample_support[s] > min_support for s in called_subset)
+    # (samples are drawn with replacement, so weight by times drawn)
+    subset_draws = Counter(called_subset)
+    n_supported_samples = sum(subset_draws[s] for s, count
+                              in sample_support.items() if count > min_support)
     if n_supported_samples / len(called_subset) >= min_frac_samples:
         opp_strand = make_new_record(supporting_pairs, record)
 
+        # The original record is replaced by the rescanned pair, so update
+        # it in place instead of copying every sample's FORMAT data again
         same_strand_pairs = [p for p in cluster if p.strandA != missing_strand]
-        same_strand = make_new_record(same_strand_pairs, record, True)
-        same_strand.id = record.id
+        same_strand = make_new_record(same_strand_pairs, record, True,
+                                      in_place=True)
 
         # Print statement that single ender rescan has been successful
         if not quiet:
@@ -225,21 +263,37 @@ def rescan_single_ender(record, pe, min_support=4, window=1000, dist=300,
         return record, None
 
 
-def make_new_record(pairs, old_record, retain_algs=False):
-    record = old_record.copy()
-    
-    record.id = record.id + '_OPPSTRAND'
+def pair_coords(pairs):
+    """Array of (posA, posB) for each pair"""
+    coords = np.fromiter(itertools.chain.from_iterable(
+                            (p.posA, p.posB) for p in pairs),
+                         dtype=np.int64, count=2 * len(pairs))
+    return coords.reshape(-1, 2)
+
+
+def make_new_record(pairs, old_record, retain_algs=False, in_place=False):
+    """
+    Set breakpoint coordinates and strands of a record from a pair cluster.
+
+    Unless in_place is True, the record is copied and given a new ID.
+    """
+    if in_place:
+        record = old_record
+    else:
+        record = old_record.copy()
+        record.id = record.id + '_OPPSTRAND'
 
     #Take third quartile of + read positions for +/+ breakpoints
     #Take first quartile of - read positions for -/- breakpoints
+    coords = pair_coords(pairs)
     if pairs[0].strandA == '+':
-        record.pos = round(np.percentile([p.posA for p in pairs], 90), 0)
-        record.stop = round(np.percentile([p.posB for p in pairs], 90), 0)
+        posA, posB = np.percentile(coords, 90, axis=0)
         record.info['STRANDS'] = '++'
     else:
-        record.pos = round(np.percentile([p.posA for p in pairs], 10), 0)
-        record.stop = round(np.percentile([p.posB for p in pairs], 10), 0)
+        posA, posB = np.percentile(coords, 10, axis=0)
         record.info['STRANDS'] = '--'
+    record.pos = round(posA, 0)
+    record.stop = round(posB, 0)
 
     record.info['SVLEN'] = record.stop - record.pos
     if retain_algs:
@@ -10,17 +10,63 @@ Implementation of single-linkage clustering for genomic coordinates.
 Not actually an implementation of the SLINK algorithm.
 """
 
-from collections import deque
 from itertools import combinations
-from operator import itemgetter
 import numpy as np
-from scipy import sparse
-from scipy.sparse import csgraph
 
-from .utils import is_smaller_chrom
+from .utils import is_smaller_chrom, connected_components
+
+
+# Autosomes and sex chromosomes permitted by GSNode.is_allowed_chrom
+GRCH_CHROMS = frozenset([str(x) for x in range(1, 23)] + 'X Y'.split())
+UCSC_CHROMS = frozenset(['chr' + x for x in GRCH_CHROMS])
+ALLOWED_CHROMS = GRCH_CHROMS | UCSC_CHROMS
+
+
+def link_nodes(posA, chrB, posB, dist):
+    """
+    Find all pairs of nodes within clustering distance at both breakpoints.
+
+    Vectorized equivalent of testing `GSNode.clusters_with` on every pair in
+    a candidate batch. Nodes are swept in order of posA, comparing each node
+    to its k-th successor for increasing k until no successor is in range.
+
+    Parameters
+    ----------
+    posA : np.ndarray of int
+    chrB : np.ndarray
+        Secondary chromosome (or any per-chromosome code) of each node
+    posB : np.ndarray of int
+    dist : int
+
+    Returns
+    -------
+    src, dst : np.ndarray of int
+        Indices of linked node pairs
+    """
+    order = np.argsort(posA, kind='mergesort')
+    posA, chrB, posB = posA[order], chrB[order], posB[order]
+
+    src, dst = [np.empty(0, dtype=int)], [np.empty(0, dtype=int)]
+    for k in range(1, len(order)):
+        near = (posA[k:] - posA[:-k]) < dist
+
+        # posA is sorted, so no larger offset can be in range either
+        if not near.any():
+            break
+
+        linked = (near &
+                  (np.abs(posB[k:] - posB[:-k]) < dist) &
+                  (chrB[k:] == chrB[:-k]))
+        idx = np.flatnonzero(linked)
+        src.append(order[idx])
+        dst.append(order[idx + k])
+
+    return np.concatenate(src), np.concatenate(dst)
 
 
 class GSNode(object):
+    __slots__ = ('chrA', 'posA', 'chrB', 'posB', 'name')
+
     def __init__(self, chrA, posA, chrB, posB, name='.'):
         """
         Node in graph-based single-linkage clustering of genomic coordinates.
@@ -36,7 +82,8 @@ class GSNode(object):
     def sort_positions(self):
         """Force chrA, posA to be upstream of chrB, posB """
         if self.chrA == self.chrB:
-            self.posA, self.posB = sorted([self.posA, self.posB])
+            if self.posB < self.posA:
+                self.posA, self.posB = self.posB, self.posA
 
         elif not is_smaller_chrom(self.chrA, self.chrB):
             self.chrA, self.chrB = self.chrB, self.chrA
@@ -104,19 +151,16 @@ class GSNode(object):
             True if both reads are on whitelisted chromosomes.
         """
 
-        GRCh = [str(x) for x in range(1, 23)] + 'X Y'.split()
-        UCSC = ['chr' + x for x in GRCh]
-
         if isinstance(chroms, list):
             return (self.chrA in chroms) and (self.chrB in chroms)
 
         if chroms == 'GRCh':
-            return (self.chrA in GRCh) and (self.chrB in GRCh)
+            return (self.chrA in GRCH_CHROMS) and (self.chrB in GRCH_CHROMS)
         elif chroms == 'UCSC':
-            return (self.chrA in UCSC) and (self.chrB in UCSC)
+            return (self.chrA in UCSC_CHROMS) and (self.chrB in UCSC_CHROMS)
         elif chroms == 'either':
-            chromlist = GRCh + UCSC
-            return (self.chrA in chromlist) and (self.chrB in chromlist)
+            return ((self.chrA in ALLOWED_CHROMS) and
+                    (self.chrB in ALLOWED_CHROMS))
         else:
             raise Exception('Invalid chromosome list: %s ' % chroms)
 
@@ -143,8 +187,8 @@ class GSNode(object):
             return is_smaller_chrom(self.chrA, other.chrA)
 
     def __str__(self):
-        return ('{chrA}\t{posA}\t{posB}\t{chrA}\t{name}'.format(
-                **self.__dict__))
+        return ('{0}\t{1}\t{2}\t{0}\t{3}'.format(
+                self.chrA, self.posA, self.posB, self.name))
 
 
 class GenomeSLINK(object):
@@ -181,10 +225,24 @@ class GenomeSLINK(object):
         """
         for node in self.nodes:
             # Skip nodes in blacklisted regions
-            if (self.blacklist and node.is_in(self.blacklist)):
+            if self.is_blacklisted(node):
                 continue
             yield node
 
+    def is_blacklisted(self, node):
+        """
+        Test if either breakpoint of a node falls in a blacklisted region.
+
+        Parameters
+        ----------
+        node : GSNode
+
+        Returns
+        -------
+        is_blacklisted : bool
+        """
+        return bool(self.blacklist) and node.is_in(self.blacklist)
+
     # TODO: add parameter for filter fn to apply to each node
     # Add `filter` method to nodes for subclassing?
     def get_candidates(self):
@@ -198,10 +256,12 @@ class GenomeSLINK(object):
 
         Yields
         ------
-        candidates : deque of GSNode
+        candidates : list of GSNode
         """
 
-        candidates = deque()
+        # Batches are only appended to, then handed to link_candidates as
+        # a whole, so a plain list suffices
+        candidates = []
         prev = None
 
         node_count = 0
@@ -222,45 +282,60 @@ class GenomeSLINK(object):
                     raise Exception(msg)
 
                 yield candidates
-                candidates = deque([node])
+                candidates = [node]
 
             prev = node
 
         yield candidates
 
-    def cluster_candidates(self, candidates, *args, **kwargs):
-        """Batch of clustering"""
-        n = len(candidates)
+    def link_candidates(self, candidates, *args, **kwargs):
+        """
+        Find pairs of linked nodes in a candidate batch.
 
-        # Permit clusters of size 1
-        #G = sparse.eye(n, dtype=np.uint8, format='lil')
-        G = sparse.lil_matrix((n, n), dtype=np.uint8)
+        Parameters
+        ----------
+        candidates : list of GSNode
 
-        # Add edges between nodes with overlap
-        for p1, p2 in combinations(range(n), 2):
+        Returns
+        -------
+        src, dst : list of int
+            Indices of linked node pairs
+        """
+        src, dst = [], []
+        for p1, p2 in combinations(range(len(candidates)), 2):
             node1, node2 = candidates[p1], candidates[p2]
             if node1.clusters_with(node2, self.dist, *args, **kwargs):
-                G[p1, p2] = 1
+                src.append(p1)
+                dst.append(p2)
+
+        return src, dst
+
+    def cluster_candidates(self, candidates, *args, **kwargs):
+        """Batch of clustering"""
+        if not isinstance(candidates, list):
+            candidates = list(candidates)
 
         # Get indices of connected components
-        n_comp, comp_list = csgraph.connected_components(G, connection='weak')
-        cluster_names = np.arange(n_comp)
+        src, dst = self.link_candidates(candidates, *args, **kwargs)
 
-        # Remove clusters with less than minimum size
-        cluster_sizes = [np.sum(comp_list == i) for i in cluster_names]
-        cluster_sizes = np.array(cluster_sizes)
-        cluster_names = cluster_names[np.where(cluster_sizes >= self.size)]
+        # Without any links, every node is a singleton cluster
+        if len(src) == 0:
+            if self.size <= 1:
+                for node in sorted(candidates, key=lambda v: v.posA):
+                    yield [node]
+            return
+
+        n_comp, comp_list = connected_components(len(candidates), src, dst)
+
+        # Group nodes by component
+        members = [[] for _ in range(n_comp)]
+        for node, comp in zip(candidates, comp_list.tolist()):
+            members[comp].append(node)
 
-        # Convert indices back to lists of Nodes
+        # Remove clusters with less than minimum size
         # Sort clusters internally by first read's position
-        clusters = deque()
-        for cname in cluster_names:
-            cluster_idx = np.where(comp_list == cname)[0]
-            if len(cluster_idx) == 1:
-                cluster = [candidates[cluster_idx[0]]]
-            else:
-                cluster = itemgetter(*cluster_idx)(candidates)
-            clusters.append(sorted(cluster, key=lambda v: (v.posA, v.name)))
+        clusters = [sorted(m, key=lambda v: (v.posA, v.name))
+                    for m in members if len(m) >= self.size]
 
         # Then sort clusters by first pair's first read's position
         for cluster in sorted(clusters, key=lambda c: c[0].posA):
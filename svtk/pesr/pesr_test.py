@@ -43,26 +43,25 @@ class PESRTest:
         """
 
         # Restrict to called or background samples
-        counts = counts.loc[counts['sample'].isin(samples + background)].copy()
+        eligible = pd.Index(samples + background, name='sample')
+        counts = counts.loc[counts['sample'].isin(eligible)]
 
         # Return null score if no eligible clipped reads present
         if counts.shape[0] == 0:
             return self.null_score()
 
         # Add called and background samples with no observed clipped reads
-        counts = counts.set_index('sample')['count']\
-                       .reindex(samples + background)\
-                       .fillna(0).reset_index()
+        filled = np.zeros(len(eligible))
+        idx = eligible.get_indexer(counts['sample'])
+        filled[idx] = counts['count'].fillna(0).to_numpy(dtype=float)
 
-        # Label samples
-        counts['is_called'] = counts['sample'].isin(samples)
+        # Calculate enrichment (median is 0 if called in all samples)
+        n_called = len(samples)
+        called = np.median(filled[:n_called]) if n_called > 0 else 0.0
+        bg = np.median(filled[n_called:]) if len(background) > 0 else 0.0
 
-        # Calculate enrichment
-        result = counts.groupby('is_called')['count'].median()
-
-        # Fill 0 if called in all samples
-        result = result.reindex([True, False]).fillna(0)
-        result.index = ['called', 'background']
+        result = pd.Series([called, bg], ['called', 'background'],
+                           name='count')
         pval = ss.poisson.cdf(result.background, result.called)
         result['log_pval'] = np.abs(np.log10(pval))
 
@@ -102,26 +101,29 @@ class PESRTestRunner:
         self.log = log
 
     def run(self):
-        if self.log:
-            start = datetime.datetime.now()
+        if not self.log:
+            for record in self.vcf:
+                self.test_record(record)
+            return
+
+        start = datetime.datetime.now()
 
         for i, record in enumerate(self.vcf):
             t0 = datetime.datetime.now()
             self.test_record(record)
             t1 = datetime.datetime.now()
 
-            if self.log:
-                n_records = i + 1
-                var_time = (t1 - t0).total_seconds()
-                total_time = (t1 - start).total_seconds()
-                hours, remainder = divmod(total_time, 3600)
-                minutes, seconds = divmod(remainder, 60)
-
-                msg = ('%d variants processed. '
-                       'Time to process last variant: %0.2f seconds. '
-                       'Total time elapsed: %d hours, %d minutes, %0.2f seconds.')
-                msg = msg % (n_records, var_time, int(hours), int(minutes), seconds)
-                sys.stderr.write(msg + '\n')
+            n_records = i + 1
+            var_time = (t1 - t0).total_seconds()
+            total_time = (t1 - start).total_seconds()
+            hours, remainder = divmod(total_time, 3600)
+            minutes, seconds = divmod(remainder, 60)
+
+            msg = ('%d variants processed. '
+                   'Time to process last variant: %0.2f seconds. '
+                   'Total time elapsed: %d hours, %d minutes, %0.2f seconds.')
+            msg = msg % (n_records, var_time, int(hours), int(minutes), seconds)
+            sys.stderr.write(msg + '\n')
 
     def test_record(self, record):
         called, background = self.choose_background(record)
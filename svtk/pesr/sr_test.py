@@ -15,6 +15,19 @@ import pandas as pd
 from .pesr_test import PESRTest, PESRTestRunner
 
 
+def rank_positions(results):
+    """
+    Order tested positions by descending log_pval, then descending distance.
+
+    Equivalent to sort_values(['log_pval', 'dist'], ascending=False), but
+    returns row positions without reordering the table.
+    """
+    log_pval = results['log_pval'].to_numpy(dtype=float)
+    dist = results['dist'].to_numpy(dtype=float)
+
+    return np.lexsort((-dist, -log_pval))
+
+
 class SRTest(PESRTest):
     def __init__(self, countfile, window=50, medians=None):
         self.countfile = countfile
@@ -51,11 +64,11 @@ class SRTest(PESRTest):
             resultB = self._test_coord(record, 'posB', record.info['CHR2'], called, background)
             resultB['coord'] = 'posB'
 
-            if (record.chrom == record.info['CHR2']) and (int(resultA.pos) >= int(resultB.pos)):
+            if (record.chrom == record.info['CHR2']) and (int(resultA.pos.iloc[0]) >= int(resultB.pos.iloc[0])):
                 rec = 1
                 while True:
                     result = self._test_coord_V2(record, 'posB', record.chrom, called, background, rec)
-                    if int(result.pos) > int(resultA.pos.iloc[0]):
+                    if int(result.pos.iloc[0]) > int(resultA.pos.iloc[0]):
                         result['coord'] = 'posB'
                         resultB = result
                         break
@@ -84,23 +97,16 @@ class SRTest(PESRTest):
                 coord, strand = record.stop, record.info['STRANDS'][1]
 
             # Run SR test at each position
-            results = []
-            for pos in range(coord - self.window, coord + self.window + 1):
-                result = self.test(chrom, pos, strand, samples, background)
-                result = result.to_frame().transpose()
-                result['pos'] = pos
-                result['dist'] = np.abs(pos - coord)
-                results.append(result)
-
-            results = pd.concat(results, ignore_index=True)
+            results = self._test_window(chrom, coord, strand, samples,
+                                        background)
 
             # Choose most significant position, using distance to predicted
             # breakpoint as tiebreaker
-            results = results.sort_values(['log_pval', 'dist'], ascending=False)
+            ranks = rank_positions(results)
             if optimal<len(results):
-                best = results.iloc[optimal].to_frame().transpose()
+                best = results.iloc[ranks[optimal]].to_frame().transpose()
             else:
-                best = results.iloc[-1].to_frame().transpose()
+                best = results.iloc[ranks[-1]].to_frame().transpose()
                 best['log_pval']=0
                 best['pos']=record.stop+self.window+1
             return best
@@ -150,12 +156,12 @@ class SRTest(PESRTest):
         cols = 'chrom pos clip count sample'.split()
         #  dtypes = dict(chrom=str, pos=int, clip=str, count=int, sample=str)
 
-        counts = pd.DataFrame.from_records([l[:5] for l in lines], columns=cols)
-        counts['count'] = counts['count'].astype(int)
-
         # Restrict to splits in orientation of interest
         clip = 'right' if strand == '+' else 'left'
-        counts = counts.loc[counts['clip'] == clip].copy()
+        lines = [l[:5] for l in lines if l[2] == clip]
+
+        counts = pd.DataFrame.from_records(lines, columns=cols)
+        counts['count'] = counts['count'].astype(int)
 
         return counts
 
@@ -172,6 +178,73 @@ class SRTest(PESRTest):
 
         return total
 
+    def load_window_counts(self, chrom, start, end, strand, samples):
+        """
+        Load clipped read counts for a window as a positions x samples array.
+
+        Equivalent to running load_counts() and normalize_counts() at each
+        position in [start, end], but with a single tabix query. Samples
+        without observed (or normalizable) counts are filled with zero.
+        """
+
+        counts = np.zeros((end - start + 1, len(samples)))
+        columns = dict((sample, i) for i, sample in enumerate(samples))
+
+        # Tabix positions are 1-based; nothing can be loaded before the
+        # start of the contig
+        if end > 0:
+            region = '{0}:{1}-{2}'.format(chrom, max(start, 1), end)
+            try:
+                lines = self.countfile.fetch(region)
+            except ValueError:
+                lines = []
+        else:
+            lines = []
+
+        # Restrict to splits in orientation of interest
+        clip = 'right' if strand == '+' else 'left'
+        for l in lines:
+            col = columns.get(l[4])
+            if l[2] != clip or col is None:
+                continue
+            pos = int(l[1])
+            if start <= pos <= end:
+                counts[pos - start, col] = int(l[3])
+
+        if self.medians is not None:
+            median_cov = self.medians.set_index('sample')['median_cov']
+            median_cov = median_cov.reindex(samples).to_numpy(dtype=float)
+            counts = np.round(counts * 60 / median_cov)
+            counts[np.isnan(counts)] = 0
+
+        return counts
+
+    def _test_window(self, chrom, coord, strand, samples, background):
+        """Test enrichment at each position within window of coord"""
+        start, end = coord - self.window, coord + self.window
+        counts = self.load_window_counts(chrom, start, end, strand,
+                                         samples + background)
+
+        # Median of an empty group (e.g. called in all samples) is 0
+        n_called = len(samples)
+        called = np.zeros(counts.shape[0])
+        bg = np.zeros(counts.shape[0])
+        if n_called > 0:
+            called = np.median(counts[:, :n_called], axis=1)
+        if len(background) > 0:
+            bg = np.median(counts[:, n_called:], axis=1)
+
+        pval = ss.poisson.cdf(bg, called)
+
+        positions = np.arange(start, end + 1)
+        results = pd.DataFrame({'background': bg,
+                                'called': called,
+                                'log_pval': np.abs(np.log10(pval)),
+                                'pos': positions,
+                                'dist': np.abs(positions - coord)})
+
+        return results
+
     def _test_coord(self, record, coord, chrom, samples, background):
         """Test enrichment at all positions within window"""
         if coord == 'posA':
@@ -180,20 +253,12 @@ class SRTest(PESRTest):
             coord, strand = record.stop, record.info['STRANDS'][1]
 
         # Run SR test at each position
-        results = []
-        for pos in range(coord - self.window, coord + self.window + 1):
-            result = self.test(chrom, pos, strand, samples, background)
-            result = result.to_frame().transpose()
-            result['pos'] = pos
-            result['dist'] = np.abs(pos - coord)
-            results.append(result)
-
-        results = pd.concat(results, ignore_index=True)
+        results = self._test_window(chrom, coord, strand, samples, background)
 
         # Choose most significant position, using distance to predicted
         # breakpoint as tiebreaker
-        results = results.sort_values(['log_pval', 'dist'], ascending=False)
-        best = results.iloc[0].to_frame().transpose()
+        ranks = rank_positions(results)
+        best = results.iloc[ranks[0]].to_frame().transpose()
 
         return best
 
@@ -11,6 +11,9 @@ Standardize a MELT record.
 from .standardize import VCFStandardizer
 
 
+_MELT_ALGORITHMS = ('melt', )
+
+
 @VCFStandardizer.register('melt')
 class MeltStandardizer(VCFStandardizer):
     def standardize_info(self, std_rec, raw_rec):
@@ -24,22 +27,24 @@ class MeltStandardizer(VCFStandardizer):
         5) Add ALGORITHMS.
         """
 
+        info = std_rec.info
+
         # Rename SVTYPE subclasses to INS
-        std_rec.info['SVTYPE'] = 'INS'
+        info['SVTYPE'] = 'INS'
 
         # Add END
         std_rec.stop = raw_rec.pos + 1
 
         # Add STRANDS
-        std_rec.info['STRANDS'] = '+-'
+        info['STRANDS'] = '+-'
 
         # Add CHR2
-        std_rec.info['CHR2'] = raw_rec.chrom
+        info['CHR2'] = raw_rec.chrom
 
         # Add SVLEN
-        std_rec.info['SVLEN'] = raw_rec.info['SVLEN']
+        info['SVLEN'] = raw_rec.info['SVLEN']
 
         # Add ALGORITHMS
-        std_rec.info['ALGORITHMS'] = ['melt']
+        info['ALGORITHMS'] = _MELT_ALGORITHMS
 
         return std_rec
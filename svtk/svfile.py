@@ -14,6 +14,21 @@ from .utils import recip, make_bnd_alt, update_best_genotypes, samples_overlap,
 from .genomeslink import GSNode
 
 
+# Integer codes for SV classes and strand pairs. Unlisted values are
+# assigned the next free code when first encountered. Strand codes pack one
+# bit per breakpoint ('-' = 1), first breakpoint in the high bit.
+SVTYPE_CODE = {'DEL': 0, 'DUP': 1, 'INV': 2, 'BND': 3, 'INS': 4}
+STRAND_CODE = {'++': 0, '+-': 1, '-+': 2, '--': 3}
+
+
+def encode(codes, value):
+    """Look up the integer code of a value, assigning one if necessary"""
+    code = codes.get(value)
+    if code is None:
+        code = codes.setdefault(value, len(codes))
+    return code
+
+
 class SVFile(object):
     def __init__(self, vcf):
         """
@@ -65,6 +80,11 @@ class SVFile(object):
             msg = msg.format(chrom, start)
             raise ValueError(msg)
 
+        # A VCF without the contig in its header has no records there
+        if chrom not in self.reader.header.contigs:
+            self.reader = iter(())
+            return
+
         # First check if VCF is empty
         try:
             pos = self.reader.tell()
@@ -104,7 +124,10 @@ class SVRecord(GSNode):
         """
 
         self.record = record
-        self.sources = record.info['ALGORITHMS']
+
+        # Integer codes of SVTYPE and STRANDS, encoded on first use
+        self._svtype_code = None
+        self._strand_code = None
 
         chrA = record.chrom
         posA = record.pos
@@ -130,7 +153,7 @@ class SVRecord(GSNode):
         """
 
         # If svtypes don't match, skip remaining calculations for efficiency
-        if match_svtypes and self.svtype != other.svtype:
+        if match_svtypes and self.svtype_code != other.svtype_code:
             return False
 
         # If both records have an INS subclass specified, require it to match
@@ -142,7 +165,7 @@ class SVRecord(GSNode):
 
         # If strands are required to match and don't, skip remaining calcs
         if match_svtypes and match_strands:
-            if self.record.info['STRANDS'] != other.record.info['STRANDS']:
+            if self.strand_code != other.strand_code:
                 return False
 
         clusters = (super().clusters_with(other, dist) and
@@ -192,6 +215,30 @@ class SVRecord(GSNode):
         """
         return self.record.info['SVTYPE']
 
+    @property
+    def sources(self):
+        """
+        Returns
+        -------
+        sources : tuple of str
+            Algorithms which called the record
+        """
+        return self.record.info['ALGORITHMS']
+
+    @property
+    def svtype_code(self):
+        """Integer code of svtype (see SVTYPE_CODE)"""
+        if self._svtype_code is None:
+            self._svtype_code = encode(SVTYPE_CODE, self.svtype)
+        return self._svtype_code
+
+    @property
+    def strand_code(self):
+        """Integer code of STRANDS (see STRAND_CODE)"""
+        if self._strand_code is None:
+            self._strand_code = encode(STRAND_CODE, self.record.info['STRANDS'])
+        return self._strand_code
+
     @property
     def is_tloc(self):
         return self.chrA != self.chrB
@@ -365,15 +412,12 @@ class SVRecordCluster:
             Populated record
         """
 
-        # Seed with null values
-        for sample in new_record.samples:
-            new_record.samples[sample]['GT'] = (0, 0)
-
-            #  for source in sourcelist:
-                #  new_record.samples[sample][source] = 0
-
         # Update with called samples
         if preserve_genotypes:
+            # Seed with null values
+            for data in new_record.samples.values():
+                data['GT'] = (0, 0)
+
             for fmt in new_record.format.keys():
                 if fmt != 'GT':
                     del new_record.format[fmt]
@@ -385,17 +429,18 @@ class SVRecordCluster:
         # TODO: optionally permit ./. instead of rejecting
         # I think that was an issue with one caller, maybe handle in preproc
         else:
+            # Collect samples called in any record, then set each sample's
+            # genotype once
             null_GTs = [(0, 0), (None, None), (0, ), (None, )]
+            called = set()
             for record in self.records:
-                for sample in record.record.samples:
-                    gt = record.record.samples[sample]['GT']
-    
+                for sample, data in record.record.samples.items():
                     # Skip samples without a call
-                    if gt in null_GTs:
-                        continue
-    
-                    # Otherwise call the sample in the new record
-                    new_record.samples[sample]['GT'] = (0, 1)
+                    if data['GT'] not in null_GTs:
+                        called.add(sample)
+
+            for sample, data in new_record.samples.items():
+                data['GT'] = (0, 1) if sample in called else (0, 0)
 
         return new_record
 
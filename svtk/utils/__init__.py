@@ -2,6 +2,7 @@ from .utils import *
 from .bgzipfile import BgzipFile
 from .s3bam import load_s3bam
 from .helpers import is_excluded, is_soft_clipped, reciprocal_overlap, overlap_frac
+from .helpers import connected_components, reciprocal_overlap_links
 from .multi_tabixfile import MultiTabixFile
 from .genotype_merging import update_best_genotypes
 from .rdtest import RdTest
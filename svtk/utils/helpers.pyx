@@ -1,6 +1,7 @@
 #cython: language_level=3
 from pysam.libcalignedsegment cimport AlignedSegment
 from pysam.libcalignmentfile cimport AlignmentFile
+import numpy as np
 
 cdef inline int int_max(int a, int b): return a if a >= b else b
 cdef inline int int_min(int a, int b): return a if a <= b else b
@@ -51,3 +52,109 @@ cpdef float overlap_frac(int startA, int endA, int startB, int endB):
 
     return frac
 
+
+cdef inline Py_ssize_t find_root(Py_ssize_t[:] parent, Py_ssize_t i):
+    # Path halving
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+def connected_components(Py_ssize_t n, src, dst):
+    """
+    Label connected components of an undirected graph with union-find.
+
+    Components are numbered in order of their lowest-indexed node, matching
+    scipy.sparse.csgraph.connected_components.
+
+    Parameters
+    ----------
+    n : int
+        Number of nodes
+    src, dst : array-like of int
+        Endpoints of each edge
+
+    Returns
+    -------
+    n_comp : int
+    labels : np.ndarray of int
+    """
+    cdef const Py_ssize_t[:] s = np.asarray(src, dtype=np.intp)
+    cdef const Py_ssize_t[:] d = np.asarray(dst, dtype=np.intp)
+    cdef Py_ssize_t[:] parent = np.arange(n, dtype=np.intp)
+    labels = np.empty(n, dtype=np.intp)
+    cdef Py_ssize_t[:] labels_view = labels
+    cdef Py_ssize_t i, a, b, n_comp = 0
+
+    # Keep the lowest-indexed node of each component as its root
+    for i in range(s.shape[0]):
+        a = find_root(parent, s[i])
+        b = find_root(parent, d[i])
+        if a < b:
+            parent[b] = a
+        elif b < a:
+            parent[a] = b
+
+    # Roots precede the rest of their component, so each node's root has
+    # already been labeled when the node is reached
+    for i in range(n):
+        a = find_root(parent, i)
+        if a == i:
+            labels_view[i] = n_comp
+            n_comp += 1
+        else:
+            labels_view[i] = labels_view[a]
+
+    return n_comp, labels
+
+
+cdef inline bint reaches(long long overlap, long long size, double frac):
+    return overlap > 0 and <double> overlap / size >= frac
+
+def reciprocal_overlap_links(starts, ends, double frac):
+    """
+    Find pairs of intervals with reciprocal overlap of at least frac.
+
+    Parameters
+    ----------
+    starts, ends : array-like of int
+        Interval coordinates, sorted by start
+    frac : float
+
+    Returns
+    -------
+    src, dst : np.ndarray of int
+        Positions of linked intervals in the input arrays
+    """
+    cdef const long long[:] s = np.asarray(starts, dtype=np.longlong)
+    cdef const long long[:] e = np.asarray(ends, dtype=np.longlong)
+    cdef Py_ssize_t n = s.shape[0]
+    cdef Py_ssize_t i, j, n_links, k
+    cdef long long overlap
+
+    # Count links first so the outputs can be allocated once
+    src = dst = None
+    cdef Py_ssize_t[:] src_view, dst_view
+    for k in range(2):
+        n_links = 0
+        for i in range(n):
+            for j in range(i + 1, n):
+                # Later intervals start further downstream, so once one
+                # can't be overlapped enough neither can the rest
+                if not reaches(e[i] - s[j], e[i] - s[i], frac):
+                    break
+
+                overlap = (e[i] if e[i] <= e[j] else e[j]) - s[j]
+                if (reaches(overlap, e[i] - s[i], frac) and
+                        reaches(overlap, e[j] - s[j], frac)):
+                    if k == 1:
+                        src_view[n_links] = i
+                        dst_view[n_links] = j
+                    n_links += 1
+
+        if k == 0:
+            src = np.empty(n_links, dtype=np.intp)
+            dst = np.empty(n_links, dtype=np.intp)
+            src_view, dst_view = src, dst
+
+    return src, dst
@@ -9,6 +9,7 @@ Helper functions for svtk.
 """
 
 from collections import deque
+from functools import lru_cache
 import pysam
 import pybedtools as pbt
 
@@ -41,6 +42,24 @@ def is_smaller_chrom(chrA, chrB):
         return chrA.isdigit()
 
 
+@lru_cache(maxsize=None)
+def chrom_sort_key(chrom):
+    """
+    Natural sort key for a chromosome, ordered as by is_smaller_chrom.
+
+    Numeric chromosomes sort numerically and before X/Y (and any other
+    non-numeric contigs), which sort lexically. A "chr" prefix is ignored.
+    """
+
+    if chrom.startswith('chr'):
+        chrom = chrom[3:]
+
+    if chrom.isdigit():
+        return (0, int(chrom), '')
+    else:
+        return (1, 0, chrom)
+
+
 def recip(startA, endA, startB, endB, frac):
     """
     Test if two intervals share a specified reciprocal overlap.
@@ -16,10 +16,18 @@ maximum individual clustering distance across the libraries being analyzed.
 
 import heapq
 import re
+from functools import lru_cache
+import tempfile
 import pkg_resources
-from pysam import VariantFile
-from svtk.svfile import SVFile, SVRecordCluster, SVRecord
-from svtk.genomeslink import GenomeSLINK
+import numpy as np
+from pysam import VariantFile, asTuple
+from svtk.svfile import SVFile, SVRecordCluster, SVRecord, SVTYPE_CODE, encode
+from svtk.genomeslink import GenomeSLINK, link_nodes
+from svtk.utils import get_called_samples, samples_overlap, chrom_sort_key
+
+
+REGION_EXP = re.compile(r'(.*):(\d+)-(\d+)')
+INFO_TAG_EXP = re.compile(r'^##INFO=<ID=([^,>]+)', re.MULTILINE)
 
 
 class VCFCluster(GenomeSLINK):
@@ -28,7 +36,8 @@ class VCFCluster(GenomeSLINK):
                  match_strands=True, match_svtypes=True, preserve_ids=False,
                  region=None, blacklist=None, svtypes=None,
                  preserve_genotypes=False, sample_overlap=0.0,
-                 preserve_header=False):
+                 preserve_header=False, sorted_samples=None,
+                 sorted_sources=None):
         """
         Clustering of VCF records.
 
@@ -70,11 +79,25 @@ class VCFCluster(GenomeSLINK):
             specified, all svtypes will be clustered.
         sample_overlap : float, optional
             Minimum fraction of samples to overlap to cluster variants
+        sorted_samples : list of str, optional
+            Sorted union of samples in the VCFs, if already known (e.g. when
+            clustering many regions of the same VCFs). Skips sorting them.
+        sorted_sources : list of str, optional
+            Sorted union of sources in the VCFs, if already known.
         """
 
-        # Wrap VCFs as SVFiles
+        # Wrap VCFs as SVFiles, collecting the unique sources and samples
+        # to construct VCF header
         self.vcfs = vcfs
-        svfiles = [SVFile(vcf) for vcf in vcfs]
+        svfiles = []
+        sources = set()
+        samples = set()
+
+        for vcf in vcfs:
+            svfile = SVFile(vcf)
+            svfiles.append(svfile)
+            sources.update(svfile.sources)
+            samples.update(svfile.samples)
 
         # Fetch region of interest
         if region is not None:
@@ -82,34 +105,67 @@ class VCFCluster(GenomeSLINK):
             for svfile in svfiles:
                 svfile.fetch(chrom, start, end)
 
-        # Merge sorted SV files
-        nodes = heapq.merge(*svfiles)
-
-        # Make lists of unique sources and samples to construct VCF header
-        sources = set()
-        samples = set()
-
-        for svfile in svfiles:
-            sources = sources.union(svfile.sources)
-            samples = samples.union(svfile.samples)
+        # Merge sorted SV files, comparing records by a precomputed integer
+        # key instead of SVRecord.__lt__
+        contigs = [c for vcf in vcfs for c in vcf.header.contigs]
+        nodes = heapq.merge(*svfiles, key=make_merge_key(contigs))
 
         # Parameterize clustering
         self.frac = frac
         self.match_strands = match_strands
         self.match_svtypes = match_svtypes
         self.svtypes = svtypes
+
+        # Bit mask of the svtype codes eligible for clustering
+        self._svtypes_mask = None
+        if svtypes is not None:
+            self._svtypes_mask = 0
+            for svtype in svtypes:
+                self._svtypes_mask |= 1 << encode(SVTYPE_CODE, svtype)
+
         self.preserve_ids = preserve_ids
         self.preserve_genotypes = preserve_genotypes
         self.sample_overlap = sample_overlap
         self.preserve_header = preserve_header
 
-        # Build VCF header for new record construction
-        self.samples = sorted(samples)
-        self.sources = sorted(sources)
-        self.header = self.make_vcf_header()
+        # VCF header for new record construction is built on first use
+        self.samples = presorted(samples, sorted_samples, 'samples')
+        self.sources = presorted(sources, sorted_sources, 'sources')
+        self._header = None
+
+        # Read the blacklist once rather than querying it for every record
+        self._blacklist_regions = {}
+        if blacklist is not None:
+            self._blacklist_regions = load_blacklist(blacklist)
 
         super().__init__(nodes, dist, 1, blacklist)
 
+    @property
+    def header(self):
+        """pysam.VariantHeader used to construct clustered records"""
+        if self._header is None:
+            self._header = self.make_vcf_header()
+        return self._header
+
+    def _blacklisted(self, chrom, pos):
+        """Test if a position falls inside a preloaded blacklist region"""
+        if chrom not in self._blacklist_regions:
+            return False
+
+        starts, ends = self._blacklist_regions[chrom]
+        i = np.searchsorted(ends, pos, side='right')
+        return bool(i < len(starts) and starts[i] <= pos)
+
+    def is_blacklisted(self, node):
+        """
+        Test if either breakpoint of a record falls in a blacklisted region.
+
+        Equivalent to `node.is_in(self.blacklist)`, using the preloaded
+        blacklist regions.
+        """
+        return (self._blacklisted(node.chrA, node.posA) or
+                self._blacklisted(node.chrB, node.posB))
+
     def filter_nodes(self):
         """
         Filter records before clustering.
@@ -125,21 +181,134 @@ class VCFCluster(GenomeSLINK):
         node : svfile.SVRecord
         """
 
+        svtypes_mask = self._svtypes_mask
+
+        # Check coordinates before looking up INFO fields in the record
         for node in super().filter_nodes():
-            if self.svtypes is not None and node.svtype not in self.svtypes:
+            if not node.is_allowed_chrom():
                 continue
-            if 'SECONDARY' in node.record.info:
+            if (svtypes_mask is not None and
+                    not (1 << node.svtype_code) & svtypes_mask):
                 continue
-            if not node.is_allowed_chrom():
+            if 'SECONDARY' in node.record.info:
                 continue
             yield node
 
+    def link_candidates(self, candidates, frac=0.0, match_strands=False,
+                        match_svtypes=True, sample_overlap=0.0):
+        """
+        Find pairs of linked records in a candidate batch.
+
+        Vectorized equivalent of testing `SVRecord.clusters_with` on every
+        pair of candidates, with the earlier candidate of each pair as the
+        reference record.
+
+        Returns
+        -------
+        src, dst : np.ndarray of int
+            Indices of linked record pairs
+        """
+        n = len(candidates)
+        posA = np.fromiter((r.posA for r in candidates), dtype=np.int64,
+                           count=n)
+        posB = np.fromiter((r.posB for r in candidates), dtype=np.int64,
+                           count=n)
+        chrB = np.array([r.chrB for r in candidates])
+
+        # Pairs within clustering distance at both breakpoints
+        src, dst = link_nodes(posA, chrB, posB, self.dist)
+        src, dst = np.minimum(src, dst), np.maximum(src, dst)
+
+        # Most batches are a single record or have no pairs within distance,
+        # so skip reading any INFO fields
+        if src.shape[0] == 0:
+            return src, dst
+
+        svtypes = np.fromiter((r.svtype_code for r in candidates),
+                              dtype=np.int64, count=n)
+        is_ins = svtypes == SVTYPE_CODE['INS']
+        linked = np.ones(src.shape[0], dtype=bool)
+
+        if match_svtypes:
+            linked &= svtypes[src] == svtypes[dst]
+
+            # If both records have an INS subclass specified, require it to
+            # match. Otherwise, permit clustering if one or both don't have
+            # a subclass
+            alts = np.array([r.record.alts[0] if ins else ''
+                             for r, ins in zip(candidates, is_ins)])
+            linked &= ~(is_ins[src] & (alts[src] != alts[dst]) &
+                        (alts[src] != '<INS>'))
+
+            # Only read STRANDS of records in a pair that is still linked
+            if match_strands:
+                strands = np.zeros(n, dtype=np.uint8)
+                for idx in np.union1d(src[linked], dst[linked]):
+                    strands[idx] = candidates[idx].strand_code
+                linked &= strands[src] == strands[dst]
+
+        if frac != 0:
+            linked &= self._overlaps(candidates, posA, posB, is_ins,
+                                     src, dst, frac)
+
+        src, dst = src[linked], dst[linked]
+
+        # Only compute sample overlap for records eligible to cluster
+        if sample_overlap > 0 and src.shape[0] > 0:
+            called = {}
+            for idx in np.union1d(src, dst):
+                called[idx] = get_called_samples(candidates[idx].record)
+
+            linked = np.array([samples_overlap(called[a], called[b],
+                                               sample_overlap, sample_overlap)
+                               for a, b in zip(src, dst)], dtype=bool)
+            src, dst = src[linked], dst[linked]
+
+        return src, dst
+
+    @staticmethod
+    def _overlaps(candidates, posA, posB, is_ins, src, dst, frac):
+        """
+        Vectorized `SVRecord.overlaps` over pairs of candidates.
+
+        Translocations always overlap. Insertions are modeled as the
+        insertion site plus SVLEN, and overlap if either length is unknown.
+        """
+        is_tloc = np.array([r.is_tloc for r in candidates], dtype=bool)
+        ins = is_ins[src]
+
+        # SVLEN only defines the intervals of insertion pairs, so skip
+        # reading it from any other record
+        svlen = np.zeros(len(candidates), dtype=np.int64)
+        for idx in np.union1d(src[ins], dst[ins]):
+            svlen[idx] = candidates[idx].record.info['SVLEN']
+
+        startA, startB = posA[src], posA[dst]
+        endA = np.where(ins, posA[src] + svlen[src], posB[src])
+        endB = np.where(ins, posA[dst] + svlen[dst], posB[dst])
+
+        olen = np.minimum(endA, endB) - np.maximum(startA, startB)
+        lenA, lenB = endA - startA, endB - startB
+
+        # Zero-length intervals never meet the overlap requirement
+        with np.errstate(divide='ignore', invalid='ignore'):
+            recip = ((lenA != 0) & (lenB != 0) & (olen > 0) &
+                     (olen / lenA >= frac) & (olen / lenB >= frac))
+
+        unknown_ins = ins & ((svlen[src] == -1) | (svlen[dst] == -1))
+
+        return is_tloc[src] | unknown_ins | recip
+
     def cluster(self, merge=True):
         """
         Yields
         ------
         record : SVRecord
         """
+        # Build the header before any records are read, since it may add
+        # samples to the header of the first VCF
+        header = self.header
+
         clusters = super().cluster(frac=self.frac,
                                    match_strands=self.match_strands,
                                    match_svtypes=self.match_svtypes,
@@ -149,16 +318,21 @@ class VCFCluster(GenomeSLINK):
             cluster = SVRecordCluster(records)
 
             if merge:
-                record = self.header.new_record()
+                record = header.new_record()
                 record = cluster.merge_record_data(record)
+
+                # Merged coordinates are final, so skip merging genotypes
+                # and INFO for blacklisted records
+                if (self._blacklist_regions and
+                        self.is_blacklisted(SVRecord(record))):
+                    continue
+
                 record = cluster.merge_record_formats(record, self.sources,
                                                       self.preserve_genotypes)
-                record = cluster.merge_record_infos(record, self.header)
+                record = cluster.merge_record_infos(record, header)
                 if self.preserve_ids:
                     record.info['MEMBERS'] = tuple(r.record.id for r in records)
 
-                if SVRecord(record).is_in(self.blacklist):
-                    continue
                 yield record
             else:
                 yield cluster
@@ -185,17 +359,10 @@ class VCFCluster(GenomeSLINK):
 
             return header
 
-        # Read stock template
-        template = pkg_resources.resource_filename(
-                        'svtk', 'data/vcfcluster_template.vcf')
-
-        # Make header
-        template = VariantFile(template)
-        header = template.header
-
-        # Add samples
-        for sample in self.samples:
-            header.add_sample(sample)
+        # Compose the header as text and parse it once, rather than adding
+        # each line and sample to a pysam header individually
+        lines = list(template_header_lines())
+        info_tags = set(INFO_TAG_EXP.findall('\n'.join(lines)))
 
         # Add contigs
         contigs = []
@@ -207,40 +374,164 @@ class VCFCluster(GenomeSLINK):
 
         contig_line = '##contig=<ID={0},length={1}>'
         for contig in contigs:
-            header.add_line(contig_line.format(*contig))
+            lines.append(contig_line.format(*contig))
 
         # Add INFO
         infos = []
         for vcf in self.vcfs:
             for tag, info in vcf.header.info.items():
-                if tag in header.info.keys():
+                if tag in info_tags:
                     continue
                 tup = (info.name, info.number, info.type, info.description)
                 if tup not in infos:
                     infos.append(tup)
-        
+
         info_line = '##INFO=<ID={0},Number={1},Type={2},Description="{3}">'
         for info in infos:
-            header.add_line(info_line.format(*info))
-        
-        if self.preserve_ids and 'MEMBERS' not in header.info.keys():
+            lines.append(info_line.format(*info))
+            info_tags.add(info[0])
+
+        if self.preserve_ids and 'MEMBERS' not in info_tags:
             info = ('##INFO=<ID=MEMBERS,Number=.,Type=String,'
                     'Description="IDs of cluster\'s constituent records.">')
-            header.add_line(info)
+            lines.append(info)
 
         # Add source
         sourcelist = sorted(set(self.sources))
-        header.add_line('##source={0}'.format(','.join(sourcelist)))
+        lines.append('##source={0}'.format(','.join(sourcelist)))
 
         # Add source FORMAT fields
         meta = ('##FORMAT=<ID={0},Number=1,Type=Integer,'
-                'Description="Called by {1}"')
+                'Description="Called by {1}">')
         for source in self.sources:
-            header.add_line(meta.format(source, source.capitalize()))
+            lines.append(meta.format(source, source.capitalize()))
+
+        # Add samples
+        columns = 'CHROM POS ID REF ALT QUAL FILTER INFO'.split()
+        if len(self.samples) > 0:
+            columns += ['FORMAT'] + self.samples
+        lines.append('#' + '\t'.join(columns))
+
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.vcf') as fout:
+            fout.write('\n'.join(lines) + '\n')
+            fout.flush()
+            with VariantFile(fout.name) as template:
+                header = template.header.copy()
 
         return header
 
 
+def presorted(values, sorted_values=None, name='values'):
+    """
+    Sort a set of values, unless a sorted list of them is provided.
+
+    Parameters
+    ----------
+    values : set
+    sorted_values : list, optional
+        Trusted to be `sorted(values)`; only its length is checked.
+    name : str, optional
+        Description of the values for error messages
+
+    Returns
+    -------
+    list
+    """
+    if sorted_values is None:
+        return sorted(values)
+
+    if len(sorted_values) != len(values):
+        msg = 'Expected {0} sorted {1}, got {2}'
+        msg = msg.format(len(values), name, len(sorted_values))
+        raise ValueError(msg)
+
+    return list(sorted_values)
+
+
+@lru_cache(maxsize=None)
+def template_header_lines():
+    """Metadata lines of the vcfcluster template, read once per process"""
+    template = pkg_resources.resource_string(
+                    'svtk', 'data/vcfcluster_template.vcf')
+    return tuple(line for line in template.decode('utf-8').splitlines()
+                 if line.startswith('##'))
+
+
+def make_merge_key(contigs):
+    """
+    Build a sort key of nodes by chromosome and position of their first
+    breakpoint, packed into a single integer.
+
+    Contigs are ranked in chrom_sort_key order and the rank occupies the bits
+    above the 32-bit position. Contigs absent from the provided list are
+    ranked after all others, in the order they are first encountered.
+
+    Parameters
+    ----------
+    contigs : iterable of str
+        Contigs declared in the VCF headers
+
+    Returns
+    -------
+    merge_key : function
+        Maps a GSNode to an int
+    """
+
+    contigs = set(contigs)
+    keys = sorted(set(chrom_sort_key(chrom) for chrom in contigs))
+    key_ranks = dict((key, i) for i, key in enumerate(keys))
+    ranks = dict((chrom, key_ranks[chrom_sort_key(chrom)])
+                 for chrom in contigs)
+
+    def merge_key(node):
+        rank = ranks.get(node.chrA)
+        if rank is None:
+            rank = ranks.setdefault(node.chrA, len(keys) + len(ranks))
+        return (rank << 32) | node.posA
+
+    return merge_key
+
+
+def load_blacklist(blacklist):
+    """
+    Read a tabix-indexed bed into merged, sorted intervals per chromosome.
+
+    Overlapping and abutting intervals are merged, so a position is
+    blacklisted if it lies in [start, end) of the single interval with the
+    smallest end greater than it.
+
+    Parameters
+    ----------
+    blacklist : pysam.TabixFile
+
+    Returns
+    -------
+    regions : dict of {str: (np.ndarray, np.ndarray)}
+        Interval starts and ends on each chromosome
+    """
+
+    regions = {}
+    for chrom in blacklist.contigs:
+        intervals = sorted((int(row[1]), int(row[2]))
+                           for row in blacklist.fetch(chrom, parser=asTuple()))
+
+        starts, ends = [], []
+        for start, end in intervals:
+            if end <= start:
+                continue
+            if ends and start <= ends[-1]:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+
+        if starts:
+            regions[chrom] = (np.array(starts, dtype=np.int64),
+                              np.array(ends, dtype=np.int64))
+
+    return regions
+
+
 def parse_region(region):
     """
     Parameters
@@ -259,8 +550,7 @@ def parse_region(region):
     if ':' not in region:
         return region, None, None
 
-    exp = re.compile(r'(.*):(\d+)-(\d+)')
-    match = exp.match(region)
+    match = REGION_EXP.match(region)
     chrom, start, end = match.group(1, 2, 3)
 
     return chrom, int(start), int(end)